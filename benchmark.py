@@ -0,0 +1,205 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from host_client import run_host
+from player_client import tournament_player
+
+
+def house_count(player_count: int) -> int:
+    # Mirrors Tournament.assign_players_to_houses
+    if player_count >= 9:
+        return (player_count // 9) * 3 + (2 if player_count % 9 >= 6 else 0)
+    return 2 if player_count >= 6 else 1
+
+
+def match_count(player_count: int) -> int:
+    matches: int = 0
+    while player_count >= 3:
+        player_count = house_count(player_count)
+        matches += player_count
+    return matches
+
+
+class ProcessSampler:
+    # Linux /proc based CPU and RSS sampling of the server process
+    def __init__(self, pid: int) -> None:
+        self.pid: int = pid
+        self.ticks: float = os.sysconf("SC_CLK_TCK")
+        self.page_size: int = os.sysconf("SC_PAGE_SIZE")
+        self.start_cpu: float = self.cpu_seconds()
+        self.peak_rss: int = 0
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as stat:
+            fields: List[str] = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_bytes(self) -> int:
+        with open(f"/proc/{self.pid}/statm") as statm:
+            return int(statm.read().split()[1]) * self.page_size
+
+    async def run(self, interval: float = 0.5) -> None:
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            await asyncio.sleep(interval)
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.join_latency: List[float] = []
+        self.fan_out_latency: List[float] = []
+        self.answer_rtt: List[float] = []
+        self.connect_started: Dict[str, float] = {}
+        self.round_started: Dict[tuple, float] = {}
+        self.answer_sent: Dict[str, float] = {}
+        self.house_of: Dict[str, tuple] = {}
+
+    def player_events(self, lobby_id: str):
+        def on_event(name: str, username: str, **data: Any) -> None:
+            now: float = time.perf_counter()
+            key: str = f"{lobby_id}/{username}"
+            if name == "joined":
+                self.join_latency.append(now - self.connect_started.pop(key))
+            elif name == "round_ongoing" and key in self.house_of:
+                self.fan_out_latency.append(now - self.round_started[self.house_of[key]])
+            elif name == "answer_sent":
+                self.answer_sent[key] = now
+        return on_event
+
+    def host_events(self, lobby_id: str, joined: asyncio.Event, player_count: int):
+        def on_event(name: str, **data: Any) -> None:
+            now: float = time.perf_counter()
+            if name == "waiting_for_start" and len(data["players"]) >= player_count:
+                joined.set()
+            elif name == "prep_game":
+                for player in data["players"]:
+                    self.house_of[f"{lobby_id}/{player['username']}"] = (lobby_id, data["house"])
+            elif name == "started_round":
+                self.round_started[(lobby_id, data["house"])] = now
+            elif name == "ui_update":
+                sent: Optional[float] = self.answer_sent.pop(f"{lobby_id}/{data['player']['username']}", None)
+                if sent is not None:
+                    self.answer_rtt.append(now - sent)
+        return on_event
+
+
+async def run_lobby(api_base: str, ws_base: str, player_count: int, display_time: float, think_time: tuple, recorder: Recorder) -> None:
+    loop = asyncio.get_running_loop()
+    lobby_id: str = await loop.run_in_executor(None, lambda: json.load(urllib.request.urlopen(f"{api_base}/host")))
+
+    joined: asyncio.Event = asyncio.Event()
+    host = asyncio.create_task(run_host(
+        lobby_id, ws_base, start=joined.wait(), display_time=display_time,
+        matches=match_count(player_count), on_event=recorder.host_events(lobby_id, joined, player_count), verbose=False,
+    ))
+    await asyncio.sleep(0.5)
+
+    players: List[asyncio.Task] = []
+    for i in range(player_count):
+        username: str = f"bench{i}"
+        recorder.connect_started[f"{lobby_id}/{username}"] = time.perf_counter()
+        players.append(asyncio.create_task(tournament_player(
+            lobby_id, username, ws_base, think_time=think_time, on_event=recorder.player_events(lobby_id), verbose=False,
+        )))
+
+    try:
+        await host
+    finally:
+        for player in players:
+            player.cancel()
+        await asyncio.gather(*players, return_exceptions=True)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+async def wait_for_server(api_base: str, timeout: float = 30) -> None:
+    deadline: float = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(f"{api_base}/docs")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    api_base: str = f"http://127.0.0.1:{args.port}"
+    ws_base: str = f"ws://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    try:
+        await wait_for_server(api_base)
+        sampler: ProcessSampler = ProcessSampler(server.pid)
+        sampling = asyncio.create_task(sampler.run())
+        recorder: Recorder = Recorder()
+
+        start: float = time.perf_counter()
+        results = await asyncio.gather(*(
+            run_lobby(api_base, ws_base, args.players, args.display_time, (args.min_think, args.max_think), recorder)
+            for _ in range(args.lobbies)
+        ), return_exceptions=True)
+        elapsed: float = time.perf_counter() - start
+        sampling.cancel()
+
+        return {
+            "lobbies": args.lobbies,
+            "players_per_lobby": args.players,
+            "failed_lobbies": sum(isinstance(r, BaseException) for r in results),
+            "wall_seconds": elapsed,
+            "join_latency": summarize(recorder.join_latency),
+            "fan_out_latency": summarize(recorder.fan_out_latency),
+            "answer_rtt": summarize(recorder.answer_rtt),
+            "server_cpu_seconds": sampler.cpu_seconds() - sampler.start_cpu,
+            "server_peak_rss_mb": sampler.peak_rss / 2 ** 20,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test a local uvicorn server with N lobbies x M players")
+    parser.add_argument("--lobbies", type=int, default=10)
+    parser.add_argument("--players", type=int, default=9)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--display-time", type=float, default=0.5)
+    parser.add_argument("--min-think", type=float, default=0.5)
+    parser.add_argument("--max-think", type=float, default=2.0)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = asyncio.run(benchmark(args))
+    text: str = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import string
+import subprocess
+import sys
+from typing import Iterator, List, Optional, Tuple
+
+from structured_logging import setup_logging
+
+# The first character of a lobby ID names the worker that owns the lobby
+WORKER_ALPHABET: str = string.ascii_uppercase + string.digits
+WORKER_ID: int = int(os.environ.get("WORKER_ID", "0"))
+WORKER_COUNT: int = int(os.environ.get("WORKER_COUNT", "1"))
+
+MAX_HEADER_BYTES: int = 65536
+CHUNK_SIZE: int = 65536
+CLOSE_TIMEOUT: float = 5
+RESTART_DELAY: float = 1
+
+logger = logging.getLogger(__name__)
+
+
+def lobby_prefix(worker_id: int = WORKER_ID) -> str:
+    return WORKER_ALPHABET[worker_id]
+
+
+def worker_of(lobby_id: str, worker_count: int) -> Optional[int]:
+    index: int = WORKER_ALPHABET.find(lobby_id[:1].upper())
+    if index < 0 or index >= worker_count:
+        return None
+    return index
+
+
+def lobby_from_path(path: str) -> Optional[str]:
+    # /ws/{lobby_id}, /ws/host/{lobby_id} and /leaderboard/{lobby_id}
+    parts: List[str] = path.split("?", 1)[0].strip("/").split("/")
+    if len(parts) == 2 and parts[0] in ("ws", "leaderboard"):
+        return parts[1]
+    if len(parts) == 3 and parts[:2] == ["ws", "host"]:
+        return parts[2]
+    return None
+
+
+def metrics_worker(path: str) -> Optional[str]:
+    # /metrics/{worker}, each worker keeps its own registry
+    parts: List[str] = path.split("?", 1)[0].strip("/").split("/")
+    if parts[0] != "metrics":
+        return None
+    return parts[1] if len(parts) == 2 else ""
+
+
+def close_after_response(head: bytes) -> bytes:
+    # Plain HTTP requests get Connection: close, the worker then closes after its response
+    # and the client's next request comes back through the front to be routed again
+    lines: List[bytes] = head[:-4].split(b"\r\n")
+    if any(line.lower().startswith(b"upgrade:") for line in lines[1:]):
+        return head
+    kept: List[bytes] = [line for line in lines[1:] if not line.lower().startswith((b"connection:", b"keep-alive:"))]
+    return b"\r\n".join([lines[0], *kept, b"Connection: close"]) + b"\r\n\r\n"
+
+
+class Worker:
+    def __init__(self, worker_id: int, worker_count: int, port: int) -> None:
+        self.worker_id: int = worker_id
+        self.worker_count: int = worker_count
+        self.port: int = port
+        self.process: Optional[subprocess.Popen] = None
+
+    def spawn(self) -> None:
+        env = dict(os.environ, WORKER_ID=str(self.worker_id), WORKER_COUNT=str(self.worker_count))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+        )
+        logger.info(f"Started worker {self.worker_id} on port {self.port} (pid {self.process.pid})")
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+# Front process: reads the request head, picks a worker and then only splices
+# bytes, so websocket frames are never decoded twice
+class Front:
+    def __init__(self, workers: List[Worker]) -> None:
+        self.workers: List[Worker] = workers
+        self.round_robin: Iterator[Worker] = itertools.cycle(workers)
+
+    def pick(self, path: str) -> Tuple[Optional[Worker], str]:
+        # The worker and the path to ask it for
+        worker_id: Optional[str] = metrics_worker(path)
+        if worker_id is not None:
+            # A round-robined scrape would mix every worker's counters, so /metrics
+            # needs the worker index and a bare /metrics is not found
+            if not worker_id.isdigit() or int(worker_id) >= len(self.workers):
+                return None, path
+            return self.workers[int(worker_id)], "/metrics"
+        return self.pick_lobby(path), path
+
+    def pick_lobby(self, path: str) -> Optional[Worker]:
+        lobby_id: Optional[str] = lobby_from_path(path)
+        if lobby_id is None:
+            # GET /host and everything else can go anywhere
+            return next(self.round_robin)
+        index: Optional[int] = worker_of(lobby_id, len(self.workers))
+        return self.workers[index] if index is not None else None
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        try:
+            head: bytes = await client_reader.readuntil(b"\r\n\r\n")
+            request_line: List[str] = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+            worker: Optional[Worker] = None
+            if len(request_line) == 3:
+                worker, path = self.pick(request_line[1])
+                if path != request_line[1]:
+                    request_line[1] = path
+                    head = " ".join(request_line).encode("latin-1") + head[head.index(b"\r\n"):]
+            if worker is None:
+                client_writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await client_writer.drain()
+                return
+
+            worker_reader, worker_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+            worker_writer.write(close_after_response(head))
+            pipes: List[asyncio.Task] = [
+                asyncio.create_task(pipe(client_reader, worker_writer)),
+                asyncio.create_task(pipe(worker_reader, client_writer)),
+            ]
+            try:
+                _, pending = await asyncio.wait(pipes, return_when=asyncio.FIRST_COMPLETED)
+                # Give the other direction time to finish the close handshake
+                if pending:
+                    await asyncio.wait(pending, timeout=CLOSE_TIMEOUT)
+            finally:
+                for task in pipes:
+                    task.cancel()
+                worker_writer.close()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError) as e:
+            logger.debug("Front connection ended: %r", e)
+        finally:
+            client_writer.close()
+
+    async def supervise(self) -> None:
+        # A restarted worker restores its started tournaments from STATE_DIR and keeps its prefix.
+        # Lobbies that never started and live websockets are lost, clients resume or rejoin.
+        while True:
+            await asyncio.sleep(RESTART_DELAY)
+            for worker in self.workers:
+                if worker.process and worker.process.poll() is not None:
+                    logger.warning(f"Worker {worker.worker_id} exited with {worker.process.returncode}, restarting")
+                    worker.spawn()
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data: bytes = await reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        # Half close so the other direction can finish its close handshake
+        if writer.can_write_eof() and not writer.is_closing():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
+
+
+async def serve(host: str, port: int, worker_count: int) -> None:
+    workers: List[Worker] = [Worker(i, worker_count, port + 1 + i) for i in range(worker_count)]
+    for worker in workers:
+        worker.spawn()
+    front: Front = Front(workers)
+    supervisor: asyncio.Task = asyncio.create_task(front.supervise())
+    server: asyncio.Server = await asyncio.start_server(front.handle, host, port, limit=MAX_HEADER_BYTES)
+    logger.info(f"Front listening on {host}:{port} with {worker_count} workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        supervisor.cancel()
+        for worker in workers:
+            worker.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run one server worker per core behind a lobby-affinity front")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if not 1 <= args.workers <= len(WORKER_ALPHABET):
+        parser.error(f"--workers must be between 1 and {len(WORKER_ALPHABET)}")
+
+    setup_logging(logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
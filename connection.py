@@ -0,0 +1,421 @@
+from __future__ import annotations
+import asyncio
+import logging
+import secrets
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from metrics import REGISTRY, Counter
+from wire import Encoding, Frame, decode, encode
+
+PHASE_QUEUE_SIZE: int = 32
+SEND_QUEUE_HIGH_WATER: int = 64
+CLOSE_TIMEOUT: float = 5
+# Frames kept for a suspended session, older ones are dropped. Stays below the
+# high-water mark so the replay can't get a resumed player evicted
+REPLAY_BUFFER_SIZE: int = 32
+# Weight of a new sample in the smoothed RTT, as in TCP's SRTT
+RTT_SMOOTHING: float = 0.125
+
+logger = logging.getLogger(__name__)
+
+connections: Set[Connection] = set()
+
+SEND_QUEUE_DROPPED: Counter = REGISTRY.counter("send_queue_dropped_total", "Outbound messages dropped or coalesced by full send queues")
+SLOW_CONSUMERS_EVICTED: Counter = REGISTRY.counter("slow_consumers_evicted_total", "Connections closed because their send queue hit the high-water mark")
+REGISTRY.gauge("websocket_connections", "Open player and host websockets", callback=lambda: len(connections))
+REGISTRY.gauge("send_queue_depth", "Messages waiting in all send queues", callback=lambda: sum(c.outbox.depth for c in connections))
+REGISTRY.gauge("send_queue_max_depth", "Deepest send queue right now", callback=lambda: max((c.outbox.depth for c in connections), default=0))
+
+
+class OverflowPolicy(str, Enum):
+    DROP = "drop"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+
+
+def message_state(data: Dict[str, Any]) -> str:
+    state: Optional[str] = data.get("state") or data.get("type")
+    if state:
+        return state
+    # player_client.py sends answers and powerups without a state
+    if "answer" in data:
+        return "answer_submitted"
+    if "powerup" in data:
+        return "powerup"
+    return "unknown"
+
+
+# Queue items are (owner, data) so several connections can share one queue,
+# data is None once the connection is gone. Frames for unsubscribed routes are dropped.
+class MessageRouter:
+    def __init__(
+        self,
+        owner: Any,
+        receive: Callable[[], Awaitable[Any]],
+        maxsize: int = PHASE_QUEUE_SIZE,
+        on_lost: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.owner: Any = owner
+        self.receive: Callable[[], Awaitable[Any]] = receive
+        self.maxsize: int = maxsize
+        self.on_lost: Optional[Callable[[], None]] = on_lost
+        self.queues: Dict[Hashable, asyncio.Queue] = {}
+        self.handlers: Dict[Hashable, Callable[[Dict[str, Any]], None]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.closed: bool = False
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.read())
+
+    def reopen(self) -> None:
+        # Bound queues and handlers survive, so a running house keeps its routes
+        self.closed = False
+
+    def pause(self) -> None:
+        # Stops reading but leaves the queues open, consumers keep waiting
+        task, self.task = self.task, None
+        if task:
+            task.cancel()
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+        self.finish()
+
+    def finish(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        for queue in self.queues.values():
+            self.put(queue, None)
+
+    def queue(self, key: Hashable) -> asyncio.Queue:
+        if key not in self.queues:
+            self.queues[key] = asyncio.Queue(maxsize=self.maxsize)
+        return self.queues[key]
+
+    def on(self, key: Hashable, handler: Callable[[Dict[str, Any]], None]) -> None:
+        # Handlers run inline in the reader for frames that need no consumer task
+        self.handlers[key] = handler
+
+    def off(self, key: Hashable) -> None:
+        self.handlers.pop(key, None)
+
+    def bind(self, key: Hashable, queue: asyncio.Queue) -> None:
+        self.queues[key] = queue
+        if self.closed:
+            self.put(queue, None)
+
+    def unbind(self, key: Hashable) -> None:
+        self.queues.pop(key, None)
+
+    def clear(self, key: Hashable) -> None:
+        clear_queue(self.queue(key))
+
+    async def get(self, key: Hashable) -> Dict[str, Any]:
+        queue: asyncio.Queue = self.queue(key)
+        if self.closed and queue.empty():
+            raise ConnectionError(f"{self.owner} disconnected")
+        _, data = await queue.get()
+        if data is None:
+            raise ConnectionError(f"{self.owner} disconnected")
+        return data
+
+    def route_keys(self, data: Dict[str, Any]) -> List[Hashable]:
+        return [message_state(data)]
+
+    def put(self, queue: asyncio.Queue, data: Optional[Dict[str, Any]]) -> None:
+        if queue.full():
+            queue.get_nowait()
+            logger.warning("Dropped oldest queued message from %s", self.owner, extra={"event": "inbound_dropped"})
+        queue.put_nowait((self.owner, data))
+
+    def dispatch(self, data: Any) -> None:
+        if not isinstance(data, dict):
+            logger.warning("Ignoring malformed message from %s: %r", self.owner, data)
+            return
+
+        for key in self.route_keys(data):
+            handler: Optional[Callable[[Dict[str, Any]], None]] = self.handlers.get(key)
+            if handler is not None:
+                handler(data)
+                continue
+            queue: Optional[asyncio.Queue] = self.queues.get(key)
+            if queue is not None:
+                self.put(queue, data)
+            else:
+                logger.debug("No route for %r from %s", key, self.owner)
+
+    async def read(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                data: Any = await self.receive()
+                if isinstance(data, dict):
+                    # Stamped on arrival, before any queueing, and never taken from the client
+                    data["received_at"] = loop.time()
+                self.dispatch(data)
+        except Exception as e:
+            logger.info(f"Reader for {self.owner} stopped: {e!r}")
+        finally:
+            # A paused or replaced reader must not touch its successor
+            if self.task is asyncio.current_task():
+                if self.on_lost:
+                    self.on_lost()
+                else:
+                    self.finish()
+
+
+class SendQueue:
+    def __init__(
+        self,
+        owner: Any,
+        send: Callable[[Frame], Awaitable[None]],
+        high_water: int = SEND_QUEUE_HIGH_WATER,
+        policy: OverflowPolicy = OverflowPolicy.DISCONNECT,
+        on_close: Optional[Callable[[], None]] = None,
+        on_lost: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.owner: Any = owner
+        self.send: Callable[[Frame], Awaitable[None]] = send
+        self.high_water: int = high_water
+        self.policy: OverflowPolicy = policy
+        self.on_close: Optional[Callable[[], None]] = on_close
+        self.on_lost: Optional[Callable[[], None]] = on_lost
+        self.items: Deque[Tuple[Optional[Hashable], Frame]] = deque()
+        self.wakeup: asyncio.Event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed: bool = False
+        self.paused: bool = False
+
+    @property
+    def depth(self) -> int:
+        return len(self.items)
+
+    def start(self) -> None:
+        self.paused = False
+        self.task = asyncio.create_task(self.write())
+
+    def reopen(self) -> None:
+        self.closed = False
+        self.items.clear()
+        self.wakeup = asyncio.Event()
+
+    def pause(self) -> None:
+        # Stops writing but keeps queueing, the queue becomes the replay buffer
+        self.paused = True
+        task, self.task = self.task, None
+        if task:
+            task.cancel()
+        self.wakeup = asyncio.Event()
+
+    def stop(self) -> None:
+        self.closed = True
+        self.items.clear()
+        if self.task:
+            self.task.cancel()
+
+    def put(self, frame: Frame, key: Optional[Hashable] = None) -> bool:
+        if self.closed:
+            return False
+
+        if self.paused and len(self.items) >= REPLAY_BUFFER_SIZE:
+            # Nobody is reading a paused queue, so there is no slow consumer to evict
+            if not self.coalesce(frame, key):
+                self.items.popleft()
+                SEND_QUEUE_DROPPED.inc()
+                self.items.append((key, frame))
+            return True
+
+        if len(self.items) >= self.high_water:
+            if self.policy == OverflowPolicy.DISCONNECT:
+                logger.warning(f"Evicting slow consumer {self.owner} at {len(self.items)} queued messages")
+                SLOW_CONSUMERS_EVICTED.inc()
+                self.close()
+                return False
+            if self.policy == OverflowPolicy.COALESCE:
+                if not self.coalesce(frame, key):
+                    self.make_room()
+                    if not self.closed:
+                        self.items.append((key, frame))
+                return True
+            self.items.popleft()
+            SEND_QUEUE_DROPPED.inc()
+            self.items.append((key, frame))
+            return True
+
+        self.items.append((key, frame))
+        self.wakeup.set()
+        return True
+
+    def coalesce(self, frame: Frame, key: Optional[Hashable]) -> bool:
+        if key is None:
+            return False
+        for i, (queued_key, _) in enumerate(self.items):
+            if queued_key == key:
+                self.items[i] = (key, frame)
+                SEND_QUEUE_DROPPED.inc()
+                return True
+        return False
+
+    def make_room(self) -> None:
+        # Keyed frames are updates a later frame supersedes, unkeyed ones (prep_round,
+        # round_ended...) are control frames a house may be waiting on and never go
+        for i, (queued_key, _) in enumerate(self.items):
+            if queued_key is not None:
+                del self.items[i]
+                SEND_QUEUE_DROPPED.inc()
+                return
+        # Nothing but control frames, suspend so a resume gets the host prompts again
+        logger.warning(f"Suspending {self.owner}, {len(self.items)} control frames queued")
+        if self.on_lost:
+            self.on_lost()
+        else:
+            self.close()
+
+    def close(self) -> None:
+        self.stop()
+        if self.on_close:
+            self.on_close()
+
+    async def write(self) -> None:
+        try:
+            while True:
+                while not self.items:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                _, frame = self.items.popleft()
+                await self.send(frame)
+        except Exception as e:
+            logger.info(f"Writer for {self.owner} stopped: {e!r}")
+            if self.task is asyncio.current_task():
+                if self.on_lost:
+                    self.on_lost()
+                else:
+                    self.close()
+
+
+class Connection:
+    __slots__ = ("websocket", "encoding", "token", "router", "outbox", "expiry", "released", "rtt")
+    router_class: type = MessageRouter
+    overflow_policy: OverflowPolicy = OverflowPolicy.DISCONNECT
+    # Seconds a dropped session is held for a resume, 0 closes it right away
+    grace_period: float = 0
+    # Default send queue limit, outbox.high_water can be raised per connection
+    high_water: int = SEND_QUEUE_HIGH_WATER
+
+    def __init__(self, websocket: Any) -> None:
+        self.websocket: Any = websocket
+        # JSON unless the client negotiated MessagePack, see wire.negotiate
+        self.encoding: Encoding = Encoding.JSON
+        self.token: str = secrets.token_urlsafe(16)
+        self.router: MessageRouter = self.router_class(self, self.receive_data, on_lost=self.suspend)
+        self.outbox: SendQueue = SendQueue(self, self.send_frame, high_water=self.high_water, policy=self.overflow_policy, on_close=self.close, on_lost=self.suspend)
+        self.expiry: Optional[asyncio.TimerHandle] = None
+        self.released: asyncio.Event = asyncio.Event()
+        # Smoothed round-trip time from keep-alive pings, None until the first pong
+        self.rtt: Optional[float] = None
+        if websocket is None:
+            # Detached until a client attaches, e.g. restored from a snapshot
+            self.router.finish()
+            self.outbox.closed = True
+
+    def start(self) -> None:
+        connections.add(self)
+        self.router.start()
+        self.outbox.start()
+
+    def attach(self, websocket: Any) -> None:
+        if self in connections:
+            # Live or suspended session: swap the socket, routes and queued frames carry over
+            self.cancel_expiry()
+            self.router.pause()
+            self.outbox.pause()
+            if self.websocket is not websocket:
+                asyncio.create_task(self.close_websocket(self.websocket))
+        else:
+            self.router.reopen()
+            self.outbox.reopen()
+        # Lets whoever waited on the previous socket go
+        self.released.set()
+        self.released = asyncio.Event()
+        self.websocket = websocket
+        self.start()
+
+    def suspend(self) -> None:
+        if self not in connections or self.suspended:
+            return
+        if not self.grace_period:
+            self.close()
+            return
+        logger.info(f"{self} dropped, holding the session for {self.grace_period}s")
+        self.router.pause()
+        self.outbox.pause()
+        self.expiry = asyncio.get_running_loop().call_later(self.grace_period, self.close)
+        asyncio.create_task(self.close_websocket(self.websocket))
+
+    def cancel_expiry(self) -> None:
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+
+    def observe_rtt(self, sample: float) -> None:
+        self.rtt = sample if self.rtt is None else self.rtt + RTT_SMOOTHING * (sample - self.rtt)
+
+    @property
+    def suspended(self) -> bool:
+        return self.expiry is not None
+
+    @property
+    def detached(self) -> bool:
+        return self not in connections
+
+    async def send_frame(self, frame: Frame) -> None:
+        if isinstance(frame, bytes):
+            await self.websocket.send_bytes(frame)
+        else:
+            await self.websocket.send_text(frame)
+
+    async def receive_data(self) -> Dict[str, Any]:
+        # Either encoding is accepted whatever was negotiated, the frame type tells them apart
+        message: Dict[str, Any] = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise ConnectionError(f"Websocket closed with code {message.get('code')}")
+        data: Dict[str, Any] = decode(message)
+        logger.debug("Received from %s: %s", self, data)
+        return data
+
+    async def send_data(self, data: Dict[str, Any], key: Optional[Hashable] = None) -> None:
+        self.enqueue(encode(data, self.encoding), key)
+        logger.debug("Sent to %s: %s", self, data)
+
+    def enqueue(self, frame: Frame, key: Optional[Hashable] = None) -> None:
+        self.outbox.put(frame, key)
+
+    def close(self) -> None:
+        if self not in connections:
+            return
+        connections.discard(self)
+        self.cancel_expiry()
+        self.router.stop()
+        self.outbox.stop()
+        self.released.set()
+        asyncio.create_task(self.close_websocket(self.websocket))
+
+    async def close_websocket(self, websocket: Any) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(), CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+    async def wait_closed(self) -> None:
+        # Returns once the session closes or another socket takes it over
+        await self.released.wait()
+
+
+
+def clear_queue(queue: asyncio.Queue) -> None:
+    while not queue.empty():
+        queue.get_nowait()
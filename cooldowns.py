@@ -0,0 +1,41 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+
+# Powerup cooldowns of one house as a ready queue bucketed by round. A powerup used in
+# round r with cooldown c is back in round r + c + 1, it waits in that round's bucket
+# until expire() reaches it. Checking a choice and expiring a round never scan history.
+class CooldownTracker:
+    def __init__(self) -> None:
+        # (row, powerup) to the round it can be used again
+        self.ready_at: Dict[Tuple[int, str], int] = {}
+        self.buckets: Dict[int, List[Tuple[int, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ready_at)
+
+    def ready(self, row: int, powerup: str, round_index: int) -> bool:
+        return self.ready_at.get((row, powerup), round_index) <= round_index
+
+    def use(self, row: int, powerup: str, round_index: int, cooldown: int) -> None:
+        ready: int = round_index + cooldown + 1
+        self.ready_at[(row, powerup)] = ready
+        self.buckets.setdefault(ready, []).append((row, powerup))
+
+    def expire(self, round_index: int) -> None:
+        for key in self.buckets.pop(round_index, ()):
+            if self.ready_at.get(key) == round_index:
+                del self.ready_at[key]
+
+    def to_snapshot(self) -> List[List]:
+        return [[row, powerup, ready] for (row, powerup), ready in self.ready_at.items()]
+
+    @classmethod
+    def restore(cls, entries: List[List], round_index: int) -> CooldownTracker:
+        tracker: CooldownTracker = cls()
+        for row, powerup, ready in entries:
+            if ready <= round_index:
+                continue
+            tracker.ready_at[(row, powerup)] = ready
+            tracker.buckets.setdefault(ready, []).append((row, powerup))
+        return tracker
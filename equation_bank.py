@@ -0,0 +1,92 @@
+from __future__ import annotations
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from equation_generator import generate_arithmetic, generate_arithmetic_batch
+
+DIFFICULTIES: Tuple[str, ...] = ("easy", "medium", "hard")
+POOL_SIZE: int = 5000
+REFILL_WATERMARK: int = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def generate_pool(difficulty: str, count: int) -> List[Tuple[str, int]]:
+    seen: Set[str] = set()
+    pool: List[Tuple[str, int]] = []
+    for equation, answer in generate_arithmetic_batch(difficulty, count):
+        if equation not in seen:
+            seen.add(equation)
+            pool.append((equation, answer))
+    return pool
+
+
+class EquationBank:
+    def __init__(self, pool_size: int = POOL_SIZE, watermark: int = REFILL_WATERMARK) -> None:
+        self.pool_size: int = pool_size
+        self.watermark: int = watermark
+        self.pools: Dict[str, Deque[Tuple[str, int]]] = {difficulty: deque() for difficulty in DIFFICULTIES}
+        self.refills: Dict[str, asyncio.Future] = {}
+
+    async def fill(self) -> None:
+        loop = asyncio.get_running_loop()
+        pools = await asyncio.gather(*(
+            loop.run_in_executor(None, generate_pool, difficulty, self.pool_size)
+            for difficulty in DIFFICULTIES
+        ))
+        for difficulty, pool in zip(DIFFICULTIES, pools):
+            self.pools[difficulty].extend(pool)
+        logger.info(f"Equation bank filled with {self.pool_size} equations per difficulty")
+
+    def take(self, difficulty: str, used: Set[str]) -> Tuple[str, int]:
+        pool: Deque[Tuple[str, int]] = self.pools[difficulty]
+        equation: Optional[str] = None
+        while pool:
+            equation, answer = pool.popleft()
+            if equation not in used:
+                break
+            equation = None
+
+        if equation is None:
+            # Cold or exhausted pool, generate inline rather than stall the round
+            logger.warning(f"Equation bank ran dry for {difficulty}")
+            equation, answer = generate_arithmetic(difficulty)
+
+        used.add(equation)
+        self.refill(difficulty)
+        return equation, answer
+
+    def refill(self, difficulty: str) -> None:
+        if len(self.pools[difficulty]) >= self.watermark or difficulty in self.refills:
+            return
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.run_in_executor(None, generate_pool, difficulty, self.pool_size)
+        self.refills[difficulty] = future
+
+        def done(future: asyncio.Future) -> None:
+            del self.refills[difficulty]
+            if future.cancelled():
+                logger.warning(f"Refilling {difficulty} equations was cancelled")
+                return
+            if future.exception():
+                logger.error(f"Refilling {difficulty} equations failed: {future.exception()!r}")
+                return
+            self.pools[difficulty].extend(future.result())
+
+        future.add_done_callback(done)
+
+    def deck(self) -> EquationDeck:
+        return EquationDeck(self)
+
+
+class EquationDeck:
+    # Per tournament view of the bank that never hands out the same equation twice
+    def __init__(self, bank: EquationBank) -> None:
+        self.bank: EquationBank = bank
+        self.used: Set[str] = set()
+
+    def draw(self, difficulty: str = "medium") -> Tuple[str, int]:
+        return self.bank.take(difficulty, self.used)
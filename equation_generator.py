@@ -1,5 +1,10 @@
 import random
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 def generate_quadratic_algebra(difficulty):
     pass
@@ -7,51 +12,93 @@ def generate_quadratic_algebra(difficulty):
 def generate_algebra(difficulty):
     pass
 
+class ExpressionBuilder:
+    # Evaluates with normal precedence while the tokens are appended, so no parsing is needed
+    def __init__(self):
+        self.tokens = []
+        self.total = 0
+        self.term = 0
+        self.sign = 1
+        self.pending_op = None
+
+    def add_number(self, num):
+        self.tokens.append(str(num))
+        if self.pending_op == "*":
+            self.term *= num
+        elif self.pending_op == "/":
+            # Dividends are always generated as a multiple of their divisor
+            self.term //= num
+        else:
+            if self.pending_op is not None:
+                self.total += self.sign * self.term
+                self.sign = 1 if self.pending_op == "+" else -1
+            self.term = num
+        self.pending_op = None
+
+    def add_op(self, op):
+        self.tokens.append(op)
+        self.pending_op = op
+
+    @property
+    def value(self):
+        return self.total + self.sign * self.term
+
+    def __str__(self):
+        return "".join(self.tokens)
+
+
 def generate_long_division(difficulty):
     if difficulty == "easy":
-        first_num_range = list(range(1, 100))
-        second_num_range = first_num_range * list(range(10, 50))
+        first_num_range = range(1, 100)
+        multiplier_range = range(10, 50)
     elif difficulty == "medium":
-        first_num_range = list(range(1, 999))
-        second_num_range = first_num_range * list(range(10, 100))
+        first_num_range = range(1, 999)
+        multiplier_range = range(10, 100)
     elif difficulty == "hard":
-        first_num_range = list(range(1, 999))
-        second_num_range = first_num_range * list(range(10, 500))
-    problem = str(first_num_range) + "/" + str(second_num_range)
-    return problem, eval(problem)
+        first_num_range = range(1, 999)
+        multiplier_range = range(10, 500)
+    divisor = random.choice(first_num_range)
+    builder = ExpressionBuilder()
+    builder.add_number(divisor * random.choice(multiplier_range))
+    builder.add_op("/")
+    builder.add_number(divisor)
+    return str(builder), builder.value
 
 def generate_long_multiplication(difficulty):
     if difficulty == "easy":
-        first_num_range = list(range(1, 100))
-        second_num_range = list(range(1, 100))
+        first_num_range = range(1, 100)
+        second_num_range = range(1, 100)
     elif difficulty == "medium":
-        first_num_range = list(range(1, 999))
-        second_num_range = list(range(1, 100))
+        first_num_range = range(1, 999)
+        second_num_range = range(1, 100)
     elif difficulty == "hard":
-        first_num_range = list(range(1, 999))
-        second_num_range = list(range(1, 999))
-    problem = str(first_num_range) + "*" + str(second_num_range)
-    return problem, eval(problem)
+        first_num_range = range(1, 999)
+        second_num_range = range(1, 999)
+    builder = ExpressionBuilder()
+    builder.add_number(random.choice(first_num_range))
+    builder.add_op("*")
+    builder.add_number(random.choice(second_num_range))
+    return str(builder), builder.value
     
+ARITHMETIC_SETTINGS = {
+    "easy": (range(3, 5), range(1, 11), range(1, 4), ("+", "-"), 1),
+    "medium": (range(4, 7), range(1, 51), range(1, 11), ("+", "-", "*"), 2),
+    "hard": (range(5, 8), range(1, 101), range(1, 21), ("+", "-", "*", "/"), 2),
+}
+
+# Operator choices with "/" (after a division) or "*" (after too many multiplications) removed
+OPS_WITHOUT = {
+    (ops, removed): tuple(op for op in ops if op != removed)
+    for _, _, _, ops, _ in ARITHMETIC_SETTINGS.values()
+    for removed in ("/", "*")
+}
+
 def generate_arithmetic(difficulty="easy"):
-    if difficulty == "easy":
-        num_count = random.randint(3, 4)
-        norm_num_range = list(range(1, 11))
-        mult_num_range = list(range(1, 4))
-        ops_allowed = ["+", "-"]
-        max_mult_in_a_row = 1
-    elif difficulty == "medium":
-        num_count = random.randint(4, 6)
-        norm_num_range = list(range(1, 51))
-        mult_num_range = list(range(1, 11))
-        ops_allowed = ["+", "-", "*"]
-        max_mult_in_a_row = 2
-    else:
-        num_count = random.randint(5, 7)
-        norm_num_range = list(range(1, 101))
-        mult_num_range = list(range(1, 21))
-        ops_allowed = ["+", "-", "*", "/"]
-        max_mult_in_a_row = 2
+    settings = ARITHMETIC_SETTINGS.get(difficulty, ARITHMETIC_SETTINGS["hard"])
+    num_count_range, norm_num_range, mult_num_range, ops_allowed, max_mult_in_a_row = settings
+    num_count = random.choice(num_count_range)
+    ops_after_division = OPS_WITHOUT[(ops_allowed, "/")]
+    ops_without_mult = OPS_WITHOUT[(ops_allowed, "*")]
 
     while True:
         divison_in = False
@@ -60,23 +107,16 @@ def generate_arithmetic(difficulty="easy"):
 
         for _ in range(num_count - 1):
             if divison_in:
-                current_ops_allowed = ops_allowed.copy()
-                if "/" in current_ops_allowed:
-                    current_ops_allowed.remove("/")
-
-                op = random.choice(current_ops_allowed)
+                op = random.choice(ops_after_division)
                 divison_in = False
                 mult_in_a_row = 0 if op != "*" else 1
                 ops.append(op)
 
             else:
-                current_ops_allowed = ops_allowed.copy()
-
                 if mult_in_a_row >= max_mult_in_a_row:
-                    if "*" in current_ops_allowed:
-                        current_ops_allowed.remove("*")
-
-                op = random.choice(current_ops_allowed)
+                    op = random.choice(ops_without_mult)
+                else:
+                    op = random.choice(ops_allowed)
 
                 if op == "*":
                     mult_in_a_row += 1
@@ -88,15 +128,15 @@ def generate_arithmetic(difficulty="easy"):
 
                 ops.append(op)
 
-        expr_parts = []
+        builder = ExpressionBuilder()
         is_division = False
         is_mult = False
         divisor = 0
 
         for op in ops:
             if is_division:
-                expr_parts.append(str(divisor))
-                expr_parts.append(op)
+                builder.add_number(divisor)
+                builder.add_op(op)
                 is_division = False
                 continue
 
@@ -105,14 +145,14 @@ def generate_arithmetic(difficulty="easy"):
                 is_mult = False
                 divisor = random.choice(mult_num_range)
                 num = divisor * random.choice(mult_num_range)
-                expr_parts.append(str(num))
-                expr_parts.append(op)
+                builder.add_number(num)
+                builder.add_op(op)
 
             elif op == "*":
                 is_mult = True
                 num = random.choice(mult_num_range)
-                expr_parts.append(str(num))
-                expr_parts.append(op)
+                builder.add_number(num)
+                builder.add_op(op)
 
             elif op in ["+", "-"]:
                 if is_mult:
@@ -120,27 +160,140 @@ def generate_arithmetic(difficulty="easy"):
                 else:
                     num = random.choice(norm_num_range)
                 is_mult = False
-                expr_parts.append(str(num))
-                expr_parts.append(op)
+                builder.add_number(num)
+                builder.add_op(op)
 
         if is_mult:
             num = random.choice(mult_num_range)
-            expr_parts.append(str(num))
+            builder.add_number(num)
         elif is_division:
-            expr_parts.append(str(divisor))
+            builder.add_number(divisor)
         else:
             num = random.choice(norm_num_range)
-            expr_parts.append(str(num))
+            builder.add_number(num)
 
-        expr = "".join(expr_parts)
-        answer = eval(expr)
+        answer = builder.value
 
         if answer < 0:
             continue
 
+        expr = str(builder)
         return expr, answer
     
 
+OPS = ("+", "-", "*", "/")
+PLUS, MINUS, MULT, DIV = range(4)
+
+def generate_arithmetic_batch(difficulty="easy", n=1000):
+    if np is None:
+        return [generate_arithmetic(difficulty) for _ in range(n)]
+
+    rng = np.random.default_rng()
+    settings = ARITHMETIC_SETTINGS.get(difficulty, ARITHMETIC_SETTINGS["hard"])
+    num_counts = rng.integers(settings[0].start, settings[0].stop, n)
+
+    equations = []
+    for num_count in settings[0]:
+        needed = int((num_counts == num_count).sum())
+        # Rejected rows are regenerated with the same num_count, like the retry loop in generate_arithmetic
+        while needed > 0:
+            batch = arithmetic_rows(rng, settings, num_count, needed + needed // 4 + 16)[:needed]
+            equations.extend(batch)
+            needed -= len(batch)
+
+    # Rows come out grouped by num_count
+    return [equations[i] for i in rng.permutation(n).tolist()]
+
+def arithmetic_rows(rng, settings, num_count, rows):
+    _, norm_num_range, mult_num_range, ops_allowed, max_mult_in_a_row = settings
+    allowed = np.array([op in ops_allowed for op in OPS])
+
+    def draw(num_range):
+        return rng.integers(num_range.start, num_range.stop, rows)
+
+    # Operators, column by column with the same constraints as generate_arithmetic
+    ops = np.empty((rows, num_count - 1), dtype=np.int64)
+    divison_in = np.zeros(rows, dtype=bool)
+    mult_in_a_row = np.zeros(rows, dtype=np.int64)
+    for column in range(num_count - 1):
+        mask = np.tile(allowed, (rows, 1))
+        mask[divison_in, DIV] = False
+        mask[~divison_in & (mult_in_a_row >= max_mult_in_a_row), MULT] = False
+        pick = (rng.random(rows) * mask.sum(axis=1)).astype(np.int64)
+        op = (mask.cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+
+        is_mult = op == MULT
+        mult_in_a_row = np.where(is_mult, np.where(divison_in, 1, mult_in_a_row + 1), 0)
+        divison_in = ~divison_in & (op == DIV)
+        ops[:, column] = op
+
+    # Operands
+    nums = np.empty((rows, num_count), dtype=np.int64)
+    is_division = np.zeros(rows, dtype=bool)
+    is_mult = np.zeros(rows, dtype=bool)
+    divisor = np.zeros(rows, dtype=np.int64)
+    for column in range(num_count - 1):
+        op = ops[:, column]
+        new_divisor = draw(mult_num_range)
+        starts_division = ~is_division & (op == DIV)
+        nums[:, column] = np.where(
+            is_division, divisor,
+            np.where(op == DIV, new_divisor * draw(mult_num_range),
+                     np.where((op == MULT) | is_mult, draw(mult_num_range), draw(norm_num_range))))
+        divisor = np.where(starts_division, new_divisor, divisor)
+        is_mult = ~is_division & (op == MULT)
+        is_division = starts_division
+    nums[:, -1] = np.where(is_mult, draw(mult_num_range), np.where(is_division, divisor, draw(norm_num_range)))
+
+    # Evaluate with precedence, the same folding ExpressionBuilder does
+    total = np.zeros(rows, dtype=np.int64)
+    sign = np.ones(rows, dtype=np.int64)
+    term = nums[:, 0].copy()
+    for column in range(num_count - 1):
+        op = ops[:, column]
+        num = nums[:, column + 1]
+        is_add = op <= MINUS
+        total = np.where(is_add, total + sign * term, total)
+        sign = np.where(op == PLUS, 1, np.where(op == MINUS, -1, sign))
+        term = np.where(op == MULT, term * num, np.where(op == DIV, term // num, np.where(is_add, num, term)))
+    answers = total + sign * term
+
+    keep = answers >= 0
+    nums, ops, answers = nums[keep], ops[keep], answers[keep]
+
+    return list(zip(render_expressions(nums, ops), answers.tolist()))
+
+def render_expressions(nums, ops):
+    rows, count = nums.shape
+    widths = np.ones_like(nums)
+    limit = 10
+    while (nums >= limit).any():
+        widths += nums >= limit
+        limit *= 10
+    total = int(widths.sum(axis=1).max()) + count - 1
+
+    # Digits are written straight into a byte matrix, one spare column at the end
+    # soaks up the writes for digits a number doesn't have
+    buf = np.zeros((rows, total + 1), dtype=np.uint8)
+    flat = buf.reshape(-1)
+    symbols = np.frombuffer("".join(OPS).encode(), dtype=np.uint8)
+    row_start = np.arange(rows) * (total + 1)
+    offset = row_start.copy()
+    for column in range(count):
+        num = nums[:, column]
+        width = widths[:, column]
+        for digit in range(int(width.max())):
+            pos = np.where(width > digit, offset + width - 1 - digit, row_start + total)
+            flat[pos] = num // 10 ** digit % 10 + ord("0")
+        offset += width
+        if column < count - 1:
+            flat[offset] = symbols[ops[:, column]]
+            offset += 1
+
+    buf[:, total] = 0
+    return np.ascontiguousarray(buf[:, :total]).view(f"S{total}").ravel().astype(str).tolist()
+
+
 # for i in range(3):
 #     print("Easy Question: ")
 #     equation, answer = generate_arithmetic(difficulty="easy")
@@ -154,4 +307,4 @@ def generate_arithmetic(difficulty="easy"):
 # for i in range(3):
 #     print("Hard Question: ")
 #     equation, answer = generate_arithmetic(difficulty="hard")
-#     print(f"Equation: {equation}, Answer: {answer}")
\ No newline at end of file
+#     print(f"Equation: {equation}, Answer: {answer}")
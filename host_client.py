@@ -1,91 +1,118 @@
 import asyncio
 import json
+import os
 import requests
 import websockets
 
-API_BASE = "http://192.168.1.27:8000"
-WS_BASE = "ws://192.168.1.27:8000"
+API_BASE = os.environ.get("API_BASE", "http://localhost:8000")
+WS_BASE = os.environ.get("WS_BASE", "ws://localhost:8000")
 
-def create_lobby():
-    """Create a new lobby via FastAPI /host_lobby endpoint."""
-    response = requests.get(f"{API_BASE}/host_lobby")
+def create_lobby(api_base=API_BASE):
+    """Create a new lobby via FastAPI /host endpoint."""
+    response = requests.get(f"{api_base}/host")
     response.raise_for_status()
     lobby_id = response.json()
     print(f"✅ Created lobby with ID: {lobby_id}")
     return lobby_id
 
 
-async def send_pings(websocket, stop_event):
-    """Send ping messages until Enter is pressed."""
-    while not stop_event.is_set():
-        ping_msg = {"state": "waiting"}
-        await websocket.send(json.dumps(ping_msg))
-        print("📤 Sent ping")
-        await asyncio.sleep(1)  # adjust interval as needed
+def apply_scoreboard(board, data):
+    """Apply a scoreboard message to a house's board in place. Returns the changed
+    rows, or None when the board is missing the delta's base and needs a resync."""
+    if data.get("full"):
+        board.update(id=data["board"], version=data["version"], players=data["players"])
+        return [(row, player) for row, player in enumerate(data["players"])]
+    if board.get("id") != data["board"] or board["version"] < data["base"]:
+        return None
+    for row, fields in data["rows"]:
+        board["players"][row].update(fields)
+    board["version"] = data["version"]
+    return [(row, fields) for row, fields in data["rows"]]
 
 
-async def wait_for_enter(stop_event):
-    """Wait for Enter key to stop the ping loop."""
+async def wait_for_enter():
+    """Wait for Enter key before starting the game."""
     loop = asyncio.get_event_loop()
     await loop.run_in_executor(None, input, "Press Enter to start...\n")
-    stop_event.set()
-    print("⏩ Enter pressed, stopping pings...")
+    print("⏩ Enter pressed, starting...")
 
 
-async def run_host(lobby_id: str):
-    """Connect as host and start the game."""
-    ws_url = f"{WS_BASE}/ws/host/{lobby_id}"
-    print(f"🔗 Connecting to {ws_url}...")
+async def run_host(lobby_id: str, ws_base=WS_BASE, start=None, display_time=5, matches=None, on_event=None, verbose=True):
+    """Connect as host, start the game once `start` resolves (Enter by default) and
+    run rounds until `matches` matches are over. on_event(name, **data) sees every event."""
+    on_event = on_event or (lambda name, **data: None)
+    log = print if verbose else (lambda *args: None)
+    ws_url = f"{ws_base}/ws/host/{lobby_id}"
+    log(f"🔗 Connecting to {ws_url}...")
 
     async with websockets.connect(ws_url) as websocket:
-        print("✅ Connected as host!")
+        log("✅ Connected as host!")
 
-        # Create an event to stop the ping loop
-        stop_event = asyncio.Event()
-
-        # Start pinging and waiting for Enter in parallel
-        ping_task = asyncio.create_task(send_pings(websocket, stop_event))
-        enter_task = asyncio.create_task(wait_for_enter(stop_event))
-
-        # Wait until Enter is pressed
-        await enter_task
+        async def receive_messages():
+            finished = 0
+            boards = {}
+            while True:
+                message = await websocket.recv()
+                data = json.loads(message)
+                state = data.get("state")
+                house = data.get("house")
+
+                if data.get("type") == "ping":
+                    await websocket.send(json.dumps({"type": "pong"}))
+
+                elif state == "waiting_for_start":
+                    log(f"👥 Players in lobby: {len(data['players'])}")
+                    on_event("waiting_for_start", players=data["players"])
+
+                elif state == "prep_game":
+                    log(f"🏠 House {house}: {[p['username'] for p in data['players']]}")
+                    on_event("prep_game", house=house, players=data["players"])
+
+                elif state == "prep_round":
+                    log(f"📝 House {house} equation to display: {data['equation']}")
+                    asyncio.create_task(start_round(house))
+
+                elif state == "scoreboard":
+                    board = boards.setdefault(house, {})
+                    changes = apply_scoreboard(board, data)
+                    if changes is None:
+                        await websocket.send(json.dumps({"state": "scoreboard_resync", "house": house}))
+                        continue
+                    await websocket.send(json.dumps({"state": "scoreboard_ack", "house": house, "board": data["board"], "version": data["version"]}))
+                    for row, fields in changes:
+                        if fields.get("answered"):
+                            on_event("ui_update", house=house, player=board["players"][row])
+
+                elif state == "round_ended":
+                    log(f"📊 House {house} round stats: {boards.get(house, {}).get('players')}")
+
+                elif state == "game_over":
+                    players = boards.get(house, {}).get("players", [])
+                    log(f"🏁 House {house} game over! Final stats: {players}")
+                    on_event("game_over", house=house, players=players)
+                    finished += 1
+                    if matches is not None and finished >= matches:
+                        return
+
+        async def start_round(house):
+            await asyncio.sleep(display_time)
+            await websocket.send(json.dumps({"state": "started_round", "house": house}))
+            on_event("started_round", house=house)
+            log(f"📤 Started round for house {house}")
+
+        receiver = asyncio.create_task(receive_messages())
+
+        await (start if start is not None else wait_for_enter())
 
         # Send the start message
         start_msg = {"state": "start_game"}
         await websocket.send(json.dumps(start_msg))
-        print(f"📤 Sent: {start_msg}")
-
-        # Stop the ping loop
-        ping_task.cancel()
-        try:
-            await ping_task
-        except asyncio.CancelledError:
-            pass
+        log(f"📤 Sent: {start_msg}")
 
-        # Handle messages from the server
         try:
-            while True:
-                message = await websocket.recv()
-                data = json.loads(message)
-                print(f"📥 Received: {data}")
-
-                if data.get("state") == "display_equation":
-                    print(f"📝 Equation to display: {data['equation']}")
-                    await asyncio.sleep(5)
-
-                    start_round = {"state": "start_round"}
-                    await websocket.send(json.dumps(start_round))
-                    print(f"📤 Sent: {start_round}")
-
-                elif data.get("state") == "display_round_stats":
-                    print(f"📊 Round stats: {data['stats']}")
-
-                elif data.get("state") == "game_ended":
-                    print(f"🏁 Game ended! Final stats: {data['stats']}")
-                    break
-
+            await receiver
         except websockets.ConnectionClosed as e:
-            print(f"⚠️ Connection closed: {e}")
+            log(f"⚠️ Connection closed: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,29 @@
+from __future__ import annotations
+from array import array
+from typing import Any, List
+
+
+# Per player round state of one house as columns, row i belongs to players[i]. Bound
+# players read and write their score, place and is_correct here for the length of the
+# match, so per round passes walk a few flat arrays instead of every Player object.
+class HouseState:
+    __slots__ = ("players", "score", "place", "correct", "elapsed")
+
+    def __init__(self, players: List[Any]) -> None:
+        self.players: List[Any] = players
+        self.score: array = array("q", (player.score for player in players))
+        self.place: array = array("q", (player.place for player in players))
+        self.correct: array = array("b", (player.is_correct for player in players))
+        # Server measured answer time of the current round, only read for rows that answered
+        self.elapsed: array = array("d", bytes(8 * len(players)))
+        for row, player in enumerate(players):
+            player.bind(self, row)
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def release(self) -> None:
+        # Hands the values back to the players, e.g. when the stage is over
+        for player in self.players:
+            if player.house_state is self:
+                player.unbind()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from wire import Encoding, Frame, encode_all
+
+PING_FRAMES: Dict[Encoding, Frame] = encode_all({"type": "ping"})
+MAX_MISSED_PONGS: int = 3
+
+logger = logging.getLogger(__name__)
+
+
+class KeepAliveWheel:
+    # Hashed timer wheel: every connection lives in one slot and the single wheel task
+    # visits one slot per tick, so each connection is pinged once per interval.
+    def __init__(self, interval: float, slot_count: int = 20, max_missed: int = MAX_MISSED_PONGS) -> None:
+        self.interval: float = interval
+        self.tick: float = interval / slot_count
+        self.max_missed: int = max_missed
+        self.slots: List[Set[Any]] = [set() for _ in range(slot_count)]
+        self.slot_of: Dict[Any, int] = {}
+        self.missed: Dict[Any, int] = {}
+        self.pinged: Dict[Any, float] = {}
+        self.cursor: int = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def add(self, connection: Any) -> None:
+        self.remove(connection)
+        # The slot just behind the cursor comes up last, a full interval from now
+        slot: int = (self.cursor - 1) % len(self.slots)
+        self.slots[slot].add(connection)
+        self.slot_of[connection] = slot
+        connection.router.on("pong", lambda data: self.pong(connection))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def remove(self, connection: Any) -> None:
+        slot: Optional[int] = self.slot_of.pop(connection, None)
+        if slot is not None:
+            self.slots[slot].discard(connection)
+        self.missed.pop(connection, None)
+        self.pinged.pop(connection, None)
+
+    def pong(self, connection: Any) -> None:
+        # Only peers that answered a ping at least once are tracked for missed pongs
+        self.missed[connection] = 0
+        sent: Optional[float] = self.pinged.pop(connection, None)
+        if sent is not None:
+            connection.observe_rtt(asyncio.get_running_loop().time() - sent)
+
+    def visit(self, slot: int) -> None:
+        now: float = asyncio.get_running_loop().time()
+        for connection in list(self.slots[slot]):
+            if connection.router.closed:
+                self.remove(connection)
+                continue
+            if connection.suspended:
+                # Nobody to ping until the session resumes
+                continue
+
+            if connection in self.missed:
+                self.missed[connection] += 1
+                if self.missed[connection] > self.max_missed:
+                    logger.info(f"Reaping {connection} after {self.max_missed} missed pongs")
+                    self.missed.pop(connection, None)
+                    connection.suspend()
+                    continue
+
+            self.pinged[connection] = now
+            connection.enqueue(PING_FRAMES[connection.encoding], key="ping")
+
+    async def run(self) -> None:
+        while self.slot_of:
+            await asyncio.sleep(self.tick)
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            self.visit(self.cursor)
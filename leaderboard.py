@@ -0,0 +1,186 @@
+from __future__ import annotations
+import random
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Nodes are keyed by -score * SEQ_LIMIT + seq: one int comparison orders by score
+# descending and breaks ties by insertion order, like a stable sort would
+SEQ_LIMIT: int = 1 << 32
+
+
+class Node:
+    __slots__ = ("key", "player", "priority", "size", "left", "right")
+
+    def __init__(self, key: int, player: Any) -> None:
+        self.key: int = key
+        self.player: Any = player
+        self.priority: float = random.random()
+        self.size: int = 1
+        self.left: Optional[Node] = None
+        self.right: Optional[Node] = None
+
+
+def size(node: Optional[Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def resize(node: Node) -> None:
+    node.size = 1 + size(node.left) + size(node.right)
+
+
+def split(node: Optional[Node], key: int) -> Tuple[Optional[Node], Optional[Node]]:
+    # (keys < key, keys >= key)
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = split(node.right, key)
+        resize(node)
+        return node, right
+    left, node.left = split(node.left, key)
+    resize(node)
+    return left, node
+
+
+def merge(left: Optional[Node], right: Optional[Node]) -> Optional[Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        resize(left)
+        return left
+    right.left = merge(left, right.left)
+    resize(right)
+    return right
+
+
+def insert(node: Optional[Node], new: Node) -> Node:
+    if node is None:
+        return new
+    if new.priority > node.priority:
+        new.left, new.right = split(node, new.key)
+        resize(new)
+        return new
+    if new.key < node.key:
+        node.left = insert(node.left, new)
+    else:
+        node.right = insert(node.right, new)
+    node.size += 1
+    return node
+
+
+def delete(node: Optional[Node], key: int) -> Optional[Node]:
+    if node is None:
+        return None
+    if node.key == key:
+        return merge(node.left, node.right)
+    if key < node.key:
+        node.left = delete(node.left, key)
+    else:
+        node.right = delete(node.right, key)
+    node.size -= 1
+    return node
+
+
+# Order-statistics treap over players. Players report score changes through
+# Player.score, so ranks stay current without re-sorting after every round.
+class Leaderboard:
+    def __init__(self, players: Iterable[Any] = ()) -> None:
+        self.root: Optional[Node] = None
+        self.nodes: Dict[Any, Node] = {}
+        self.seq: int = 0
+        for player in players:
+            self.add(player)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, player: Any) -> bool:
+        return player in self.nodes
+
+    def key(self, score: int, seq: int) -> int:
+        return -score * SEQ_LIMIT + seq
+
+    def add(self, player: Any) -> None:
+        if player in self.nodes:
+            return
+        node: Node = Node(self.key(player.score, self.seq), player)
+        self.seq += 1
+        self.nodes[player] = node
+        self.root = insert(self.root, node)
+        player.leaderboards.append(self)
+
+    def remove(self, player: Any) -> None:
+        node: Optional[Node] = self.nodes.pop(player, None)
+        if node is None:
+            return
+        self.root = delete(self.root, node.key)
+        player.leaderboards.remove(self)
+
+    def clear(self) -> None:
+        for player in list(self.nodes):
+            player.leaderboards.remove(self)
+        self.nodes.clear()
+        self.root = None
+
+    def update(self, player: Any, score: int) -> None:
+        node: Node = self.nodes[player]
+        key: int = self.key(score, node.key % SEQ_LIMIT)
+        if key == node.key:
+            return
+        self.root = delete(self.root, node.key)
+        node.key = key
+        node.left = node.right = None
+        node.size = 1
+        self.root = insert(self.root, node)
+
+    def rank(self, player: Any) -> int:
+        # 1 based, players with equal scores rank in the order they were added
+        key: int = self.nodes[player].key
+        rank: int = 1
+        node: Optional[Node] = self.root
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            else:
+                if key == node.key:
+                    return rank + size(node.left)
+                rank += size(node.left) + 1
+                node = node.right
+        raise KeyError(player)
+
+    def at(self, rank: int) -> Any:
+        node: Optional[Node] = self.root
+        while node is not None:
+            left: int = size(node.left)
+            if rank <= left:
+                node = node.left
+            elif rank == left + 1:
+                return node.player
+            else:
+                rank -= left + 1
+                node = node.right
+        raise IndexError(rank)
+
+    def winner(self) -> Any:
+        return self.at(1)
+
+    def top(self, k: int) -> List[Any]:
+        players: List[Any] = []
+        for player in self:
+            if len(players) >= k:
+                break
+            players.append(player)
+        return players
+
+    def __iter__(self) -> Iterator[Any]:
+        # In order walk, best score first
+        stack: List[Node] = []
+        node: Optional[Node] = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.player
+            node = node.right
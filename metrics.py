@@ -0,0 +1,143 @@
+from __future__ import annotations
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def repr_label(value: str) -> str:
+    return '"' + value + '"'
+
+
+def format_labels(labels: Dict[str, str], extra: str = "") -> str:
+    parts: List[str] = [f"{key}={repr_label(value)}" for key, value in labels.items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind: str = "counter"
+
+    def __init__(self, name: str, labels: Dict[str, str]) -> None:
+        self.name: str = name
+        self.labels: Dict[str, str] = labels
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{format_labels(self.labels)} {self.value}"]
+
+
+class Gauge:
+    kind: str = "gauge"
+
+    def __init__(self, name: str, labels: Dict[str, str], callback: Optional[Callable[[], float]] = None) -> None:
+        self.name: str = name
+        self.labels: Dict[str, str] = labels
+        self.callback: Optional[Callable[[], float]] = callback
+        self.value: float = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self) -> List[str]:
+        # Callback gauges are only computed on scrape
+        value: float = self.callback() if self.callback else self.value
+        return [f"{self.name}{format_labels(self.labels)} {value}"]
+
+
+class Histogram:
+    kind: str = "histogram"
+
+    def __init__(self, name: str, labels: Dict[str, str], buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name: str = name
+        self.labels: Dict[str, str] = labels
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> List[str]:
+        lines: List[str] = []
+        cumulative: int = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le: str = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, 'le=' + repr_label(le))} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels)} {self.sum}")
+        lines.append(f"{self.name}_count{format_labels(self.labels)} {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.families: Dict[str, Tuple[str, str, List[Any]]] = {}
+
+    def register(self, metric: Any, help: str) -> Any:
+        self.families.setdefault(metric.name, (metric.kind, help, []))[2].append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self.register(Counter(name, labels or {}), help)
+
+    def gauge(self, name: str, help: str, labels: Optional[Dict[str, str]] = None, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, labels or {}, callback), help)
+
+    def histogram(self, name: str, help: str, labels: Optional[Dict[str, str]] = None, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, labels or {}, buckets), help)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, (kind, help, series) in self.families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in series:
+                lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY: Registry = Registry()
+
+
+def timed(histogram: Histogram) -> Callable:
+    def decorator(function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed_async(*args: Any, **kwargs: Any) -> Any:
+                start: float = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return timed_async
+
+        @functools.wraps(function)
+        def timed_sync(*args: Any, **kwargs: Any) -> Any:
+            start: float = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return timed_sync
+    return decorator
+
+
+async def monitor_loop_lag(histogram: Histogram, gauge: Gauge, interval: float = 0.5) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start: float = loop.time()
+        await asyncio.sleep(interval)
+        lag: float = max(0.0, loop.time() - start - interval)
+        histogram.observe(lag)
+        gauge.set(lag)
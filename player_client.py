@@ -1,15 +1,19 @@
 import asyncio
 import json
+import os
 import websockets
 import random
 
-async def tournament_player(tournament_id: str, username: str):
-    uri = f"ws://localhost:8000/ws/{tournament_id}"
+WS_BASE = os.environ.get("WS_BASE", "ws://localhost:8000")
+
+async def tournament_player(tournament_id: str, username: str, ws_base=WS_BASE, think_time=(0.5, 6.0), on_event=None, verbose=True):
+    on_event = on_event or (lambda name, **data: None)
+    log = print if verbose else (lambda *args: None)
+    uri = f"{ws_base}/ws/{tournament_id}"
 
     try:
         async with websockets.connect(uri) as websocket:
             await websocket.send(json.dumps({"username": username}))
-            print(f"✅ {username} joined tournament {tournament_id}")
 
             async def receive_messages():
                 while True:
@@ -18,42 +22,44 @@ async def tournament_player(tournament_id: str, username: str):
                         data = json.loads(msg)
                         state = data.get("state")
 
-                        if state == "ping":
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps({"type": "pong"}))
                             continue
-                        elif state == "prep_tournament":
-                            print(f"🕹️ [{username}] Waiting for tournament to start...")
-                        elif state == "prep_match":
-                            print(f"⚙️ [{username}] Preparing for match...")
+                        elif state == "prep_game":
+                            log(f"✅ {username} joined tournament {tournament_id}")
+                            on_event("joined", username=username)
+                        elif state == "prep_round":
+                            log(f"⚙️ [{username}] Preparing for round...")
                         elif state == "round_ongoing":
+                            on_event("round_ongoing", username=username)
                             correct_answer = random.choice([True, False])
-                            print("Data: " + str(data))
 
                             if correct_answer:
                                 answer = data.get("answer")
                             else:
                                 answer = str(random.randint(1, 100))
                             
-                            time_took = round(random.uniform(0.5, 6.0))
+                            time_took = round(random.uniform(*think_time))
                             
                             await asyncio.sleep(time_took)
                             
-                            print(f"⏱️ [{username}] Match started! Submitting answer: {answer}")
+                            log(f"⏱️ [{username}] Submitting answer: {answer}")
+                            on_event("answer_sent", username=username)
                             await websocket.send(json.dumps({
                                 "username": username,
                                 "answer": answer,
                                 "time_took": time_took
                             }))
                         elif state == "round_ended":
-                            print(f"🏁 [{username}] Match ended! Score: {data.get('score', '?')}")
+                            log(f"🏁 [{username}] Round ended! Score: {data.get('score', '?')} Place: {data.get('place', '?')}")
                         elif state == "game_over":
-                            print(f"🎉 [{username}] Tournament ended! Final data:")
-                            print(json.dumps(data, indent=2))
-                            return
+                            log(f"🎉 [{username}] Match ended! Final data:")
+                            log(json.dumps(data, indent=2))
                         else:
-                            print(f"📩 [{username}] Message: {data}")
+                            log(f"📩 [{username}] Message: {data}")
 
                     except websockets.exceptions.ConnectionClosed:
-                        print(f"❌ [{username}] Disconnected.")
+                        log(f"❌ [{username}] Disconnected.")
                         break
 
             await receive_messages()
@@ -1,6 +1,6 @@
-from enum import Enum
+from enum import Enum, IntFlag
 from dataclasses import dataclass
-from typing import Callable, Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List, Tuple
 
 # ---------------- Enums & Core Data ----------------
 
@@ -10,6 +10,12 @@ class PowerUpState(str, Enum):
     ROUND_END = "round_end"
     AFTER_ROUND = "after_round"
 
+class Defense(IntFlag):
+    NONE = 0
+    IRON_HEART = 1
+    MIRROR_SHIELD = 2
+    FOCUS_FIELD = 4
+
 @dataclass
 class PowerUp:
     name: str
@@ -17,92 +23,108 @@ class PowerUp:
     cooldown: int
     state: PowerUpState
     effect: Optional[Callable]
+    targeted: bool = False
+    defense: Defense = Defense.NONE
+
+
+# Every effect gets the same game_data:
+#   player, target_player: the caster and its target (None for untargeted powerups)
+#   scores: points each player gained this round
+#   totals: each player's score, effects change these and the house applies them in one pass
+#   defenses: each player's Defense flags, mirror shield is used up by the first attack it reflects
+#   attacks: each player's incoming attacks, sent with round_ongoing as one message
+
+def defended(game_data, player, defense: Defense) -> bool:
+    return bool(game_data["defenses"].get(player, Defense.NONE) & defense)
 
+def reflected(game_data, player) -> bool:
+    if not defended(game_data, player, Defense.MIRROR_SHIELD):
+        return False
+    game_data["defenses"][player] &= ~Defense.MIRROR_SHIELD
+    return True
 
 def effect_future_sight(game_data) -> None:
-    player = game_data.get("player")
-    if player.is_correct == True:
-        player.score *= 1.5
-        player.score = int(player.score)
+    player = game_data["player"]
+    scores = game_data["scores"]
+    totals = game_data["totals"]
+    if player.is_correct:
+        totals[player] += int(0.5 * scores[player])
     else:
-        scores = game_data.get("scores")
-        top_player = max(scores, key=scores.get)
-        player.score -= top_player.score
+        # Nobody scored means the best gain is 0 and nothing is lost
+        totals[player] -= max(scores.values(), default=0)
 
 def effect_sword_of_justice(game_data) -> None:
-    player = game_data.get("player")
-    scores = game_data.get("scores")
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "iron_heart":
+    player = game_data["player"]
+    scores = game_data["scores"]
+    totals = game_data["totals"]
+    target_player = game_data["target_player"]
+    if defended(game_data, target_player, Defense.IRON_HEART):
         return
-    if target_player.active_powerup == "mirror_shield":
-        player.score -= int(1.5 * scores[target_player])
-        target_player.score -= scores[target_player]
-        player.active_powerup = None
+    if reflected(game_data, target_player):
+        totals[player] -= int(1.5 * scores[target_player])
+        totals[target_player] -= scores[target_player]
         return
-    
-    if player.is_correct == True:
-        player.score -= scores[player]
-        target_player.score -= int(1.5 * scores[player])
+
+    if player.is_correct:
+        totals[player] -= scores[player]
+        totals[target_player] -= int(1.5 * scores[player])
 
 def effect_decay(game_data) -> None:
-    player = game_data.get("player")
-    scores = game_data.get("scores")
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "iron_heart":
+    player = game_data["player"]
+    scores = game_data["scores"]
+    totals = game_data["totals"]
+    target_player = game_data["target_player"]
+    if defended(game_data, target_player, Defense.IRON_HEART):
         return
-    if target_player.active_powerup == "mirror_shield":
-        if target_player.is_correct == True and player.is_correct == False:
-            player.score -= scores[target_player]
-        player.active_powerup = None
+    if reflected(game_data, target_player):
+        if target_player.is_correct and not player.is_correct:
+            totals[player] -= scores[target_player]
         return
-    
-    if player.is_correct == True and target_player.is_correct == False:
-        target_player.score -= scores[player]
+
+    if player.is_correct and not target_player.is_correct:
+        totals[target_player] -= scores[player]
 
 def effect_parasite(game_data) -> None:
-    player = game_data.get("player")
-    scores = game_data.get("scores")
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "iron_heart":
+    player = game_data["player"]
+    scores = game_data["scores"]
+    totals = game_data["totals"]
+    target_player = game_data["target_player"]
+    if defended(game_data, target_player, Defense.IRON_HEART):
         return
-    if target_player.active_powerup == "mirror_shield":
-        if player.is_correct == False:
-            target_player.score -= scores[target_player]
-        elif player.is_correct == True:
-            target_player.score += 0.4 * scores[player]
-            player.score -= 0.4 * scores[player]
-        player.active_powerup = None
+    if reflected(game_data, target_player):
+        if not player.is_correct:
+            totals[target_player] -= scores[target_player]
+        else:
+            stolen = int(0.4 * scores[player])
+            totals[target_player] += stolen
+            totals[player] -= stolen
         return
-    
-    if target_player.is_correct == False:
-        player.score -= scores[player]
-    elif target_player.is_correct == True:
-        player.score += 0.4 * scores[target_player]
-        target_player.score -= 0.4 * scores[target_player]
+
+    if not target_player.is_correct:
+        totals[player] -= scores[player]
+    else:
+        stolen = int(0.4 * scores[target_player])
+        totals[player] += stolen
+        totals[target_player] -= stolen
 
 def effect_shared_destiny(game_data) -> None:
-    player = game_data.get("player")
-    scores = game_data.get("scores")
-    target_player = game_data.get("target_player")
-    averged_score = (player.score + target_player.score)/2
-    
-    if averged_score > target_player.score:
-        if target_player.active_powerup == "iron_heart":
-            return
-    
-    player.score -= scores[player]
-    target_player.score -= scores[target_player]
-    
-    player.score += averged_score
-    target_player.score += averged_score
+    player = game_data["player"]
+    totals = game_data["totals"]
+    target_player = game_data["target_player"]
+    averaged_score = (totals[player] + totals[target_player]) // 2
+
+    if averaged_score < totals[target_player] and defended(game_data, target_player, Defense.IRON_HEART):
+        return
+
+    totals[player] = averaged_score
+    totals[target_player] = averaged_score
 
 def effect_robber(game_data) -> None:
-    player = game_data.get("player")
-    scores = game_data.get("scores")
-    target_player = game_data.get("target_player")
-    if target_player.is_correct == True:
-        player.score += scores[target_player]
+    player = game_data["player"]
+    scores = game_data["scores"]
+    target_player = game_data["target_player"]
+    if target_player.is_correct:
+        game_data["totals"][player] += scores[target_player]
 
 def effect_decoy(game_data) -> None:
     pass
@@ -119,54 +141,30 @@ def effect_sneak_peek(game_data) -> None:
 def effect_confusion(game_data) -> None:
     pass
 
-def effect_kitten_storm(game_data) -> None:
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "focus_field":
+def visual_attack(game_data, attack: str) -> None:
+    player = game_data["player"]
+    target_player = game_data["target_player"]
+    if defended(game_data, target_player, Defense.FOCUS_FIELD):
+        return
+    if reflected(game_data, target_player):
+        game_data["attacks"].setdefault(player, []).append({"attack": attack, "action": "mirror_shield"})
         return
-    if target_player.active_powerup == "mirror_shield":
-        player = game_data.get("player")
-        player.active_powerup = None
-        player.send_data({"attack": "kitten_storm", "action": "mirror_shield"})
-    target_player.send_data({"attack": "kitten_storm"})
+    game_data["attacks"].setdefault(target_player, []).append({"attack": attack})
+
+def effect_kitten_storm(game_data) -> None:
+    visual_attack(game_data, "kitten_storm")
 
 def effect_reshuffle(game_data) -> None:
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "focus_field":
-        return
-    if target_player.active_powerup == "mirror_shield":
-        player = game_data.get("player")
-        player.active_powerup = None
-        player.send_data({"attack": "reshuffle", "action": "mirror_shield"})
-    target_player.send_data({"attack": "reshuffle"})
+    visual_attack(game_data, "reshuffle")
 
 def effect_reflection(game_data) -> None:
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "focus_field":
-        return
-    if target_player.active_powerup == "mirror_shield":
-        player = game_data.get("player")
-        player.active_powerup = None
-        player.send_data({"attack": "tornado", "action": "mirror_shield"})
-    target_player.send_data({"attack": "reflection"})
-    
+    visual_attack(game_data, "reflection")
+
 def effect_tornado(game_data) -> None:
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "focus_field":
-        return
-    if target_player.active_powerup == "mirror_shield":
-        player = game_data.get("player")
-        player.active_powerup = None
-        player.send_data({"attack": "tornado", "action": "mirror_shield"})
-    target_player.send_data({"attack": "tornado"})
+    visual_attack(game_data, "tornado")
 
 def effect_flashbang(game_data) -> None:
-    target_player = game_data.get("target_player")
-    if target_player.active_powerup == "focus_field":
-        return
-    if target_player.active_powerup == "mirror_shield":
-        player = game_data.get("player")
-        player.send_data({"attack": "flashbang", "action": "mirror_shield"})
-    target_player.send_data({"attack": "flashbang"})
+    visual_attack(game_data, "flashbang")
 
 def effect_close_enough(game_data) -> None:
     pass
@@ -186,7 +184,7 @@ def effect_rich_get_richer(game_data) -> None:
 def effect_fading_light(game_data) -> None:
     pass
 
-def default_effect() -> None:
+def default_effect(game_data) -> None:
     pass
 
 POWERUPS: Dict[str, PowerUp] = {
@@ -204,35 +202,40 @@ POWERUPS: Dict[str, PowerUp] = {
         description="This round you don’t keep your points. Instead, you deal 1.5x the points you would have earned to a chosen player, subtracting them from their score.",
         cooldown=2,
         state=PowerUpState.ROUND_END,
-        effect=effect_sword_of_justice
+        effect=effect_sword_of_justice,
+        targeted=True
     ),
     "decay": PowerUp(
         name="Decay",
         description="Pick a player. If you get it right and they don’t, you gain your points and they lose the same amount.",
         cooldown=2,
         state=PowerUpState.ROUND_END,
-        effect=effect_decay
+        effect=effect_decay,
+        targeted=True
     ),
     "parasite": PowerUp(
         name="Parasite",
         description="Choose a player. If they score this round, you gain 40% of their points. If they fail, you earn nothing.",
         cooldown=3,
         state=PowerUpState.ROUND_END,
-        effect=effect_parasite
+        effect=effect_parasite,
+        targeted=True
     ),
     "shared_destiny": PowerUp(
         name="Shared Destiny",
         description="Pick a player. At the end of the round, your scores are averaged and both of you receive that amount.",
         cooldown=3,
         state=PowerUpState.ROUND_END,
-        effect=effect_shared_destiny
+        effect=effect_shared_destiny,
+        targeted=True
     ),
     "robber": PowerUp(
         name="Robber",
         description="Choose another player. At the end of the round, you earn points if either your answer or theirs is correct.",
         cooldown=3,
         state=PowerUpState.ROUND_END,
-        effect=effect_robber
+        effect=effect_robber,
+        targeted=True
     ),
 
     # Trick & Deception
@@ -262,7 +265,8 @@ POWERUPS: Dict[str, PowerUp] = {
         description="Get to see another player's power-up build.",
         cooldown=2,
         state=PowerUpState.ROUND_START,
-        effect=effect_sneak_peek
+        effect=effect_sneak_peek,
+        targeted=True
     ),
     "confusion": PowerUp(
         name="Confusion",
@@ -278,35 +282,40 @@ POWERUPS: Dict[str, PowerUp] = {
         description="Cover a target player’s screen with playful kittens for a few seconds at the start of the round.",
         cooldown=2,
         state=PowerUpState.ROUND_START,
-        effect=effect_kitten_storm
+        effect=effect_kitten_storm,
+        targeted=True
     ),
     "reshuffle": PowerUp(
         name="Reshuffle",
         description="Randomly reorder another player’s numpad for the whole round.",
         cooldown=3,
         state=PowerUpState.ROUND_START,
-        effect=effect_reshuffle
+        effect=effect_reshuffle,
+        targeted=True
     ),
     "reflection": PowerUp(
         name="Reflection",
         description="Flip a player’s entire screen horizontally, forcing them to adapt.",
         cooldown=3,
         state=PowerUpState.ROUND_START,
-        effect=effect_reflection
+        effect=effect_reflection,
+        targeted=True
     ),
     "tornado": PowerUp(
         name="Tornado",
         description="A targeted player’s numpad buttons drift and move around randomly while they’re trying to answer.",
         cooldown=3,
         state=PowerUpState.ROUND_START,
-        effect=effect_tornado
+        effect=effect_tornado,
+        targeted=True
     ),
     "flashbang": PowerUp(
         name="Flashbang",
         description="The targeted player’s screen goes completely white for the first 2 seconds of the round.",
         cooldown=2,
         state=PowerUpState.ROUND_START,
-        effect=effect_flashbang
+        effect=effect_flashbang,
+        targeted=True
     ),
 
     # Defense
@@ -315,21 +324,24 @@ POWERUPS: Dict[str, PowerUp] = {
         description="Block all visual effects aimed at you for the next round.",
         cooldown=3,
         state=PowerUpState.ROUND_START,
-        effect=default_effect
+        effect=default_effect,
+        defense=Defense.FOCUS_FIELD
     ),
     "mirror_shield": PowerUp(
         name="Mirror Shield",
         description="The next attack that targets you is reflected back to the caster.",
         cooldown=3,
         state=PowerUpState.ROUND_START,
-        effect=default_effect
+        effect=default_effect,
+        defense=Defense.MIRROR_SHIELD
     ),
     "iron_heart": PowerUp(
         name="Iron Heart",
         description="Block all negative score effects aimed at you for the next round.",
         cooldown=3,
         state=PowerUpState.ROUND_END,
-        effect=default_effect
+        effect=default_effect,
+        defense=Defense.IRON_HEART
     ),
     "close_enough": PowerUp(
         name="Close Enough",
@@ -345,7 +357,8 @@ POWERUPS: Dict[str, PowerUp] = {
         description="Swap your entire power-up build with another player for the next round. (All cooldowns stay as they were.)",
         cooldown=3,
         state=PowerUpState.AFTER_ROUND,
-        effect=effect_teleportation
+        effect=effect_teleportation,
+        targeted=True
     ),
     "the_great_depression": PowerUp(
         name="The Great Depression",
@@ -376,3 +389,35 @@ POWERUPS: Dict[str, PowerUp] = {
         effect=effect_fading_light
     ),
 }
+
+
+class ScoreTable(dict):
+    # Totals of the players an effect touched, read from the player on first use
+    def __missing__(self, player):
+        self[player] = player.score
+        return player.score
+
+
+# One round of a house's powerups, grouped by the phase they run in. Defenses are folded
+# into per player flags up front, so resolving costs one call per active powerup.
+class PowerUpResolver:
+    def __init__(self, activations: List[Tuple[Any, PowerUp, Any]] = ()) -> None:
+        self.phases: Dict[PowerUpState, List[Tuple[Any, PowerUp, Any]]] = {state: [] for state in PowerUpState}
+        self.defenses: Dict[Any, Defense] = {}
+        for player, powerup, target in activations:
+            if powerup.defense:
+                self.defenses[player] = self.defenses.get(player, Defense.NONE) | powerup.defense
+            else:
+                self.phases[powerup.state].append((player, powerup, target))
+
+    def active(self, state: PowerUpState) -> bool:
+        return bool(self.phases[state])
+
+    def resolve(self, state: PowerUpState, scores: Optional[Dict[Any, int]] = None) -> Tuple[ScoreTable, Dict[Any, List[Dict[str, Any]]]]:
+        # Effects run in collection order, so the same powerups always resolve the same way
+        game_data = {"player": None, "target_player": None, "scores": scores or {}, "totals": ScoreTable(), "defenses": self.defenses, "attacks": {}}
+        for player, powerup, target in self.phases[state]:
+            game_data["player"] = player
+            game_data["target_player"] = target
+            powerup.effect(game_data)
+        return game_data["totals"], game_data["attacks"]
@@ -0,0 +1,80 @@
+from __future__ import annotations
+import itertools
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Unacked changes kept for deltas, past this the host gets a full snapshot instead
+SCOREBOARD_HISTORY: int = 256
+
+board_ids = itertools.count(1)
+
+
+# Versioned view of one house for the host. Every changed field bumps the version and
+# lands in a change log, a delta carries the current value of every field changed since
+# the version the host last acked. Values are absolute, so a delta can be applied twice.
+class Scoreboard:
+    def __init__(self, players: List[Any]) -> None:
+        # Acks name the board, so a late ack for last stage's house can't touch this one
+        self.id: int = next(board_ids)
+        self.usernames: List[str] = [player.username for player in players]
+        self.rows: List[Dict[str, Any]] = [{"score": player.score, "place": player.place, "answered": False} for player in players]
+        self.version: int = 0
+        self.acked: Optional[int] = None
+        # Versions up to floor are no longer in the log
+        self.floor: int = 0
+        self.log: Deque[Tuple[int, int, str]] = deque()
+
+    def set(self, row: int, field: str, value: Any) -> None:
+        if self.rows[row][field] == value:
+            return
+        self.rows[row][field] = value
+        self.version += 1
+        self.log.append((self.version, row, field))
+        if len(self.log) > SCOREBOARD_HISTORY:
+            self.log.clear()
+            self.floor = self.version
+            self.acked = None
+
+    def sync(self, players: List[Any]) -> None:
+        for row, player in enumerate(players):
+            self.set(row, "score", player.score)
+            self.set(row, "place", player.place)
+
+    def reset_answered(self) -> None:
+        for row in range(len(self.rows)):
+            self.set(row, "answered", False)
+
+    def ack(self, board: int, version: int) -> None:
+        if board != self.id or version < self.floor or version > self.version or (self.acked is not None and version <= self.acked):
+            return
+        self.acked = version
+        while self.log and self.log[0][0] <= version:
+            self.log.popleft()
+
+    def resync(self) -> None:
+        self.acked = None
+
+    def full(self) -> Dict[str, Any]:
+        return {
+            "state": "scoreboard",
+            "board": self.id,
+            "version": self.version,
+            "full": True,
+            "players": [{"username": username, **row} for username, row in zip(self.usernames, self.rows)],
+        }
+
+    def message(self) -> Optional[Dict[str, Any]]:
+        if self.acked is None:
+            return self.full()
+        if not self.log:
+            return None
+        rows: Dict[int, Dict[str, Any]] = {}
+        for _, row, field in self.log:
+            rows.setdefault(row, {})[field] = self.rows[row][field]
+        return {
+            "state": "scoreboard",
+            "board": self.id,
+            "version": self.version,
+            "base": self.acked,
+            "rows": [[row, fields] for row, fields in rows.items()],
+        }
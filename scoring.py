@@ -0,0 +1,89 @@
+from __future__ import annotations
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MIN_SCORE: int = 100
+MAX_SCORE: int = 500
+# Below this many rows the plain Python pass is faster than numpy's call overhead
+VECTORIZE_THRESHOLD: int = 64
+
+
+class RoundResults:
+    # One row per house player, in house order. Built once per round and read by
+    # the powerup effects and the round_ended broadcasts.
+    def __init__(
+        self,
+        players: List[Any],
+        correct: List[bool],
+        elapsed: List[float],
+        gained: List[int],
+        rows: Optional[Dict[Any, int]] = None,
+    ) -> None:
+        self.players: List[Any] = players
+        self.correct: List[bool] = correct
+        self.elapsed: List[float] = elapsed
+        # Points from answering, the house adds powerup score effects once they resolve
+        self.gained: List[int] = gained
+        # Player to row, the house already keeps one so it is shared rather than rebuilt
+        self.rows: Dict[Any, int] = rows if rows is not None else {player: row for row, player in enumerate(players)}
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def gained_by(self, player: Any) -> int:
+        return self.gained[self.rows[player]]
+
+    def scores(self) -> Dict[Any, int]:
+        return dict(zip(self.players, self.gained))
+
+    def apply(self, state: Optional[Any] = None) -> None:
+        # With the house's HouseState the correct column is written in one go
+        if state is not None:
+            state.correct[:] = array("b", self.correct)
+        for player, correct, gained in zip(self.players, self.correct, self.gained):
+            if state is None:
+                player.is_correct = correct
+            if gained:
+                player.score += gained
+
+
+def score_round(
+    players: List[Any],
+    answers: Dict[Any, Optional[Dict[str, Any]]],
+    answer: int,
+    time_per_question: float,
+    rows: Optional[Dict[Any, int]] = None,
+    elapsed_by: Optional[Sequence[float]] = None,
+) -> RoundResults:
+    # Parsing is the only per player Python work, the score curve runs over whole columns.
+    # elapsed_by holds server measured answer times by row, without it the client's time_took counts.
+    correct: List[bool] = []
+    elapsed: List[float] = []
+    for row, player in enumerate(players):
+        data: Optional[Dict[str, Any]] = answers.get(player)
+        took: Optional[float] = None
+        if data is not None:
+            try:
+                if int(data.get("answer")) == answer:
+                    took = elapsed_by[row] if elapsed_by is not None else float(data.get("time_took", 0))
+            except (TypeError, ValueError):
+                pass
+        correct.append(took is not None)
+        elapsed.append(time_per_question if took is None else took)
+
+    if np is not None and len(players) >= VECTORIZE_THRESHOLD:
+        t = np.clip(np.array(elapsed, dtype=np.float64) / time_per_question, 0, 1)
+        # np.rint rounds half to even like round() does below
+        score = np.rint(MIN_SCORE + (MAX_SCORE - MIN_SCORE) * (1 - t) ** 2).astype(np.int64)
+        gained: List[int] = np.where(np.array(correct), score, 0).tolist()
+    else:
+        gained = [
+            round(MIN_SCORE + (MAX_SCORE - MIN_SCORE) * (1 - min(max(t / time_per_question, 0), 1)) ** 2) if ok else 0
+            for ok, t in zip(correct, elapsed)
+        ]
+    return RoundResults(players, correct, elapsed, gained, rows)
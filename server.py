@@ -1,27 +1,70 @@
 from __future__ import annotations
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import random
 import string
 import asyncio
 import logging
 import math
-from typing import Dict, List, Optional, Any, Tuple
-
-from equation_generator import generate_arithmetic
-from powerups import POWERUPS, PowerUpState
-
-app = FastAPI()
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any, Tuple
+
+from cluster import lobby_prefix
+from cooldowns import CooldownTracker
+from connection import Connection, MessageRouter, OverflowPolicy, PHASE_QUEUE_SIZE, SEND_QUEUE_HIGH_WATER, clear_queue, message_state
+from equation_bank import EquationBank, EquationDeck
+from house_state import HouseState
+from keep_alive import KeepAliveWheel
+from leaderboard import Leaderboard
+from metrics import REGISTRY, Histogram, monitor_loop_lag, timed
+from structured_logging import setup_logging
+from powerups import POWERUPS, PowerUp, PowerUpResolver, PowerUpState
+from scoreboard import Scoreboard
+from scoring import RoundResults, score_round
+from snapshots import TournamentStore
+from wire import Encoding, Frame, decode, encode_all, fan_out, fan_out_frames, negotiate
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await equation_bank.fill()
+    for state, records in tournament_store.load(lobby_prefix()):
+        if not state.get("started"):
+            # Left behind by a lobby that never started, there is nothing to resume
+            tournament_store.remove(state["id"])
+            continue
+        tournament: Tournament = Tournament.restore(state, records)
+        lobby_manager.tournaments[tournament.id] = tournament
+        logger.info(f"Restored tournament {tournament.id} at stage {tournament.stage}")
+    lag_monitor: asyncio.Task = asyncio.create_task(monitor_loop_lag(
+        REGISTRY.histogram("event_loop_lag_seconds", "How late the event loop woke up a 0.5s sleep"),
+        REGISTRY.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample"),
+    ))
+    yield
+    lag_monitor.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 KEEP_ALIVE_INTERVAL: int = 20
 TIME_PER_QUESTION: int = 20
-IDLE_TIMEOUT: int = 3600
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
+# Journal records written before the tournament is compacted into a new snapshot
+SNAPSHOT_INTERVAL: int = 50
+# Seconds a dropped player or host can resume with their session token
+SESSION_GRACE_PERIOD: int = 60
+# Most RTT taken off an answer time, so a client can't buy time by holding pongs back
+MAX_RTT_COMPENSATION: float = 1.0
+# Host frames a single house can have queued at once: its control frame of the phase,
+# round_ongoing, a scoreboard delta and a ping's share
+HOST_FRAMES_PER_HOUSE: int = 4
+# Seconds the round results stay up before the next round is prepped
+ROUND_END_PAUSE: float = 5
+ROUND_DIFFICULTY: str = "medium"
+
+log_listener = setup_logging(logging.INFO)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,18 +77,125 @@ app.add_middleware(
 logger = logging.getLogger(__name__)
 
 
+def phase_histogram(phase: str) -> Histogram:
+    return REGISTRY.histogram("house_phase_seconds", "Wall time spent in each House phase", {"phase": phase})
+
+
 class TournamentConfig:
     def __init__(self, time_per_question):
         self.time_per_question = time_per_question
 
 
+class PreparedRound:
+    # Everything the next round_start sends, built while the last round's results are shown
+    __slots__ = ("equation", "answer", "difficulty", "host_prompt", "host_frames", "player_frames", "powerups")
+
+    def __init__(self, equation: str, answer: int, difficulty: str, host_prompt: Dict[str, Any], host_frames: Dict[Encoding, Frame], player_frames: Dict[Encoding, Frame]) -> None:
+        self.equation: str = equation
+        self.answer: int = answer
+        self.difficulty: str = difficulty
+        self.host_prompt: Dict[str, Any] = host_prompt
+        # Encoded once per wire encoding, who speaks which isn't settled until the send
+        self.host_frames: Dict[Encoding, Frame] = host_frames
+        self.player_frames: Dict[Encoding, Frame] = player_frames
+        # Collected for this round during the same pause
+        self.powerups: PowerUpResolver = PowerUpResolver()
+
+
 class Tournament:
     def __init__(self, id: str) -> None:
         self.id: str = id
         self.players: List[Player] = []
+        self.sessions: Dict[str, Player] = {}
+        self.leaderboard: Leaderboard = Leaderboard()
         self.houses: List[House] = []
         self.host: Host = None
         self.config = TournamentConfig(30)
+        self.equations: EquationDeck = equation_bank.deck()
+        self.stage: int = 0
+        self.started: bool = False
+        self.running: bool = False
+        self.journal_length: int = 0
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any], records: List[Dict[str, Any]]) -> Tournament:
+        tournament: Tournament = cls(state["id"])
+        tournament.stage = state["stage"]
+        tournament.started = state["started"]
+        tournament.players = [Player.restore(data) for data in state["players"]]
+        for player, token in zip(tournament.players, state.get("tokens", [])):
+            player.token = token
+        tournament.sessions = {player.token: player for player in tournament.players}
+        tournament.leaderboard = Leaderboard(tournament.players)
+        for house_state in state["houses"]:
+            house: House = House(None, [tournament.players[i] for i in house_state["players"]], tournament.config, tournament.equations, tournament.record_round)
+            house.round_index = house_state["round"]
+            house.cooldowns = CooldownTracker.restore(house_state.get("cooldowns", []), house.round_index)
+            tournament.houses.append(house)
+
+        for record in records:
+            # Records can predate the snapshot if we crashed before the journal was truncated
+            house = tournament.houses[record["house"]] if record["stage"] == tournament.stage else None
+            if house is None or record["round"] < house.round_index:
+                continue
+            house.round_index = record["round"] + 1
+            for player, (score, place) in zip(house.players, record["scores"]):
+                player.score = score
+                player.place = place
+            house.cooldowns = CooldownTracker.restore(record.get("cooldowns", []), house.round_index)
+        return tournament
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        index: Dict[Player, int] = {player: i for i, player in enumerate(self.players)}
+        return {
+            "id": self.id,
+            "stage": self.stage,
+            "started": self.started,
+            "players": [player.to_json() for player in self.players],
+            "tokens": [player.token for player in self.players],
+            "houses": [{"players": [index[p] for p in house.players], "round": house.round_index, "cooldowns": house.cooldowns.to_snapshot()} for house in self.houses],
+        }
+
+    def save_snapshot(self) -> None:
+        self.journal_length = 0
+        tournament_store.snapshot(self.id, self.to_snapshot())
+
+    def record_round(self, house: House) -> None:
+        self.journal_length += 1
+        if self.journal_length >= SNAPSHOT_INTERVAL:
+            self.save_snapshot()
+            return
+        tournament_store.append(self.id, {
+            "stage": self.stage,
+            "house": self.houses.index(house),
+            "round": house.round_index - 1,
+            "scores": [[p.score, p.place] for p in house.players],
+            "cooldowns": house.cooldowns.to_snapshot(),
+        })
+
+    def attach_host(self, host: Host) -> None:
+        self.host = host
+        for i, house in enumerate(self.houses):
+            house.bind_host(host.view(i))
+        self.size_host_outbox()
+
+    def size_host_outbox(self) -> None:
+        # Every house of a stage queues its host frames in the same burst, so the host's
+        # queue grows with the stage instead of suspending the host once it is big
+        if self.host:
+            self.host.outbox.high_water = max(SEND_QUEUE_HIGH_WATER, HOST_FRAMES_PER_HOUSE * len(self.houses))
+
+    async def resend_host_prompts(self) -> None:
+        # The old socket may have taken the prompt or the host's reply down with it
+        for house in self.houses:
+            if house.host_prompt and house.host:
+                await house.host.send_data(house.host_prompt)
+
+    def rejoin(self, username: str) -> Optional[Player]:
+        for player in self.players:
+            if player.username == username and player.detached:
+                return player
+        return None
 
     def assign_players_to_houses(self, players: List[Player]):
         players_copy = players.copy()
@@ -59,7 +209,7 @@ class Tournament:
                 house_amount += 2
 
             for _ in range(house_amount):
-                self.houses.append(House(self.host, players_copy[:3], self.config))
+                self.add_house(players_copy[:3])
                 del players_copy[:3]
 
             for player in players_copy:
@@ -67,45 +217,75 @@ class Tournament:
 
         else:
             if player_count >= 6:
-                self.houses.append(House(self.host, players_copy[:3], self.config))
-                self.houses.append(House(self.host, players_copy[3:], self.config))
+                self.add_house(players_copy[:3])
+                self.add_house(players_copy[3:])
             else:
-                self.houses.append(House(self.host, players_copy, self.config))
-        
+                self.add_house(players_copy)
+
+    def add_house(self, players: List[Player]) -> None:
+        house_index: int = len(self.houses)
+        self.houses.append(House(self.host.view(house_index), players, self.config, self.equations, self.record_round))
 
-    async def start_tournament(self):
+    async def start_tournament(self) -> Optional[Player]:
+        self.started = True
+        self.running = True
         current_players = self.players.copy()
         random.shuffle(current_players)
-        
 
-        while len(current_players) >= 3:
+        # A tournament restored from a snapshot resumes the stage it was in
+        while self.houses or len(current_players) >= 3:
+            if not self.houses:
+                self.host.clear_views()
+                self.assign_players_to_houses(current_players)
+                self.size_host_outbox()
+                self.stage += 1
+                self.save_snapshot()
+
+            current_players = await self.run_stage()
             self.houses.clear()
-            self.assign_players_to_houses(current_players)
-
-            winners: List[Player] = []
-            
-            for house in self.houses:
-                await self.host.send_data({
-                    "state": "prep_game",
-                    "players": [p.to_json() for p in house.players]
-                })
-                
-                await asyncio.sleep(3)
-
-                winner: Player = await house.start_match(round_count=5)
-                winners.append(winner)
-                
-                for player in house.players:
-                    player.score = 1000
-                
-            current_players = winners
-            
+
+        self.running = False
+        tournament_store.remove(self.id)
+        if not current_players:
+            # Every house of the last stage failed, or nobody joined
+            logger.error(f"Tournament {self.id} ended without a winner")
+            return None
         return current_players[0]
 
-    
+    async def run_stage(self) -> List[Player]:
+        logger.info(f"Starting stage with {len(self.houses)} houses")
+
+        for house in self.houses:
+            await house.host.send_data({
+                "state": "prep_game",
+                "players": [p.to_json() for p in house.players]
+            })
+
+        await asyncio.sleep(3)
+
+        # gather doubles as the stage barrier: the next stage only starts once every house is done
+        results = await asyncio.gather(
+            *(house.start_match(round_count=5) for house in self.houses),
+            return_exceptions=True,
+        )
+
+        winners: List[Player] = []
+        for house, result in zip(self.houses, results):
+            if isinstance(result, BaseException):
+                logger.error(f"House {house.host.house_index} failed: {result!r}")
+            else:
+                winners.append(result)
+
+            house.leaderboard.clear()
+            house.release()
+            for player in house.players:
+                player.score = 1000
+
+        return winners
+
     async def broadcast(self, state: Optional[str] = None, **extra: Any) -> None:
         data = {"state": state, **extra} if state else extra
-        await asyncio.gather(*(p.send_data(data) for p in self.players), return_exceptions=True)
+        fan_out(self.players, data)
     
     async def prepare_game(self) -> None:
         await self.broadcast(state="waiting_for_game")
@@ -121,183 +301,357 @@ class LobbyManager:
         self.matches: Dict[str, House] = {}
 
     def generate_id(self) -> str:
+        # The prefix routes the lobby back to this worker when running under cluster.py
         characters: str = string.ascii_letters + string.digits
-        id: str = ''.join(random.choice(characters) for _ in range(6)).upper()
+        id: str = lobby_prefix() + ''.join(random.choice(characters) for _ in range(5)).upper()
+        while id in self.tournaments:
+            id = lobby_prefix() + ''.join(random.choice(characters) for _ in range(5)).upper()
         logger.info(f"Generated new ID: {id}")
         return id
 
 
-class Player:
+class Player(Connection):
+    __slots__ = (
+        "leaderboards", "_score", "_place", "_correct", "username", "house_state", "row",
+        "active_powerup", "powerup_target", "active_attack",
+    )
+    grace_period = SESSION_GRACE_PERIOD
+
     def __init__(self, websocket: WebSocket, username: str) -> None:
-        self.websocket: WebSocket = websocket
-        self.score: int = 1000
+        super().__init__(websocket)
+        self.leaderboards: List[Leaderboard] = []
+        # Score, place and is_correct live in the house's columns while the player is in a match
+        self.house_state: Optional[HouseState] = None
+        self.row: int = 0
+        self._score: int = 1000
+        self._place: int = 1
+        self._correct: bool = False
         self.username: str = username
-        self.place: int = 1
-        self.active_powerup: Optional[Any] = None
+        self.active_powerup: Optional[PowerUp] = None
+        self.powerup_target: Optional[Player] = None
         self.active_attack: Optional[Any] = None
-        self.is_correct: bool = False
-        self.keep_alive_task: Optional[asyncio.Task] = None
 
-    async def send_data(self, data: Dict[str, Any]) -> None:
-        await self.websocket.send_json(data)
-        logger.debug(f"Sent to {self.username}: {data}")
+    def bind(self, state: HouseState, row: int) -> None:
+        self.house_state = state
+        self.row = row
+
+    def unbind(self) -> None:
+        state: HouseState = self.house_state
+        self._score = state.score[self.row]
+        self._place = state.place[self.row]
+        self._correct = bool(state.correct[self.row])
+        self.house_state = None
+
+    @property
+    def score(self) -> int:
+        return self._score if self.house_state is None else self.house_state.score[self.row]
+
+    @score.setter
+    def score(self, value: int) -> None:
+        # Every score change, scoring or powerup, keeps the leaderboards ordered.
+        # Scores are whole points, the columns and the leaderboard keys need ints.
+        value = int(value)
+        if self.house_state is None:
+            self._score = value
+        else:
+            self.house_state.score[self.row] = value
+        for leaderboard in self.leaderboards:
+            leaderboard.update(self, value)
+
+    @property
+    def place(self) -> int:
+        return self._place if self.house_state is None else self.house_state.place[self.row]
+
+    @place.setter
+    def place(self, value: int) -> None:
+        if self.house_state is None:
+            self._place = value
+        else:
+            self.house_state.place[self.row] = value
 
-    async def receive_data(self) -> Dict[str, Any]:
-        data: Dict[str, Any] = await self.websocket.receive_json()
-        logger.debug(f"Received from {self.username}: {data}")
-        return data
+    @property
+    def is_correct(self) -> bool:
+        return self._correct if self.house_state is None else bool(self.house_state.correct[self.row])
+
+    @is_correct.setter
+    def is_correct(self, value: bool) -> None:
+        if self.house_state is None:
+            self._correct = value
+        else:
+            self.house_state.correct[self.row] = value
+
+    @classmethod
+    def restore(cls, data: Dict[str, Any]) -> Player:
+        player: Player = cls(None, data["username"])
+        player.score = data["score"]
+        player.place = data["place"]
+        return player
 
-    async def start_keep_alive(self, interval: int = 20) -> None:
-        async def ping() -> None:
-            try:
-                while True:
-                    await self.websocket.send_json({"type": "ping"})
-                    await asyncio.sleep(interval)
-            except Exception:
-                logger.info(f"Player {self.username} disconnected")
-
-        self.keep_alive_task = asyncio.create_task(ping())
-        
     def to_json(self):
         return {"username": self.username, "score": self.score, "place": self.place}
 
+    def __repr__(self) -> str:
+        return f"Player({self.username})"
+
 
 class House:
-    def __init__(self, host: Host, players: List[Player], config: TournamentConfig) -> None:
-        self.host: Optional[Host] = host
+    __slots__ = (
+        "host", "players", "state", "scoreboard", "leaderboard", "rows", "time_per_question", "equations",
+        "on_round_end", "answer", "round_index", "results", "round_started_at", "host_prompt", "prepared",
+        "powerups", "cooldowns", "answer_queue", "powerup_queue",
+    )
+
+    def __init__(
+        self,
+        host: Optional[HostView],
+        players: List[Player],
+        config: TournamentConfig,
+        equations: EquationDeck,
+        on_round_end: Optional[Callable[[House], None]] = None,
+    ) -> None:
+        self.host: Optional[HostView] = None
         self.players: List[Player] = players
+        self.state: Optional[HouseState] = None
+        self.scoreboard: Optional[Scoreboard] = None
+        self.leaderboard: Leaderboard = Leaderboard()
+        self.rows: Dict[Player, int] = {}
+        self.bind_host(host)
         self.time_per_question: int = config.time_per_question
+        self.equations: EquationDeck = equations
+        self.on_round_end: Optional[Callable[[House], None]] = on_round_end
         self.answer: int = 0
+        self.round_index: int = 0
+        self.results: Optional[RoundResults] = None
+        self.round_started_at: float = 0.0
+        # The prep_round the host hasn't answered yet, re-sent when the host resumes
+        self.host_prompt: Optional[Dict[str, Any]] = None
+        self.prepared: Optional[PreparedRound] = None
+        self.powerups: PowerUpResolver = PowerUpResolver()
+        self.cooldowns: CooldownTracker = CooldownTracker()
+        self.answer_queue: asyncio.Queue = asyncio.Queue()
+        self.powerup_queue: asyncio.Queue = asyncio.Queue()
         logger.info(f"Created house")
 
-    def assign_player_places(self) -> None:
-        sorted_players: List[Player] = sorted(self.players, key=lambda p: p.score, reverse=True)
-        for i, player in enumerate(sorted_players):
-            player.place = i + 1
-
-    def generate_equation(self) -> Tuple[str, int]:
-        equation, answer = generate_arithmetic(difficulty="medium")
-        self.answer = answer
-        return equation, answer
-
-    async def collect_powerups(self) -> Dict[Player, Dict[str, Any]]:
-        logger.info(f"Collecting powerups from {len(self.players)} players")
-
-        tasks: Dict[Player, asyncio.Task] = {player: asyncio.create_task(player.receive_data()) for player in self.players}
-        done, _ = await asyncio.wait(tasks.values(), timeout=5)
-
-        powerups: Dict[Player, Dict[str, Any]] = {}
-        for player, task in tasks.items():
-            if task in done:
-                try:
-                    data = task.result()
-                except Exception:
-                    data = None
-            else:
-                task.cancel()
-                data = None
-                logger.warning(f"Player {player.username} did not send powerup in time")
+    def bind_host(self, host: Optional[HostView]) -> None:
+        self.host = host
+        if host is not None:
+            host.on("scoreboard_ack", self.on_scoreboard_ack)
+            host.on("scoreboard_resync", self.on_scoreboard_resync)
+        if self.scoreboard:
+            # A new host screen starts without a scoreboard
+            self.scoreboard.resync()
 
-            if data and data.get("powerup") in POWERUPS:
-                player.active_powerup = POWERUPS[data["powerup"]]
-                powerups[player] = data
-            else:
-                player.active_powerup = None
-                powerups[player] = {"powerup": "none"}
+    def on_scoreboard_ack(self, data: Dict[str, Any]) -> None:
+        try:
+            board, version = int(data["board"]), int(data["version"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if self.scoreboard:
+            self.scoreboard.ack(board, version)
+
+    def on_scoreboard_resync(self, data: Dict[str, Any]) -> None:
+        if self.scoreboard:
+            self.scoreboard.resync()
+            asyncio.create_task(self.send_scoreboard())
+
+    async def send_scoreboard(self) -> None:
+        message: Optional[Dict[str, Any]] = self.scoreboard.message() if self.scoreboard else None
+        if message and self.host:
+            await self.host.send_data(message, key="scoreboard")
+
+    def bind_players(self) -> None:
+        maxsize: int = max(PHASE_QUEUE_SIZE, 2 * len(self.players))
+        self.answer_queue = asyncio.Queue(maxsize=maxsize)
+        self.powerup_queue = asyncio.Queue(maxsize=maxsize)
+        for player in self.players:
+            player.router.bind("answer_submitted", self.answer_queue)
+            player.router.bind("powerup", self.powerup_queue)
+
+    async def receive_from_players(self, queue: asyncio.Queue, timeout: float) -> AsyncIterator[Tuple[Player, Dict[str, Any]]]:
+        loop = asyncio.get_running_loop()
+        deadline: float = loop.time() + timeout
+        pending: set = {player for player in self.players if not player.router.closed}
+
+        while pending:
+            try:
+                player, data = await asyncio.wait_for(queue.get(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            if player not in pending:
+                continue
+            pending.discard(player)
+            if data is not None:
+                yield player, data
+
+    def assign_player_places(self) -> None:
+        # The leaderboard is already in order, this is a walk rather than a sort
+        places = self.state.place
+        for place, player in enumerate(self.leaderboard, 1):
+            places[player.row] = place
 
-        logger.info(f"Collected powerups: {powerups}")
-        return powerups
+    def generate_equation(self, difficulty: str = ROUND_DIFFICULTY) -> Tuple[str, int]:
+        return self.equations.draw(difficulty=difficulty)
 
+    def prepare_round(self) -> PreparedRound:
+        equation, answer = self.generate_equation()
+        logger.debug("Equation: %s, Answer: %s", equation, answer)
+        host_prompt: Dict[str, Any] = {"state": "prep_round", "equation": equation}
+        house_index: Optional[int] = self.host.house_index if self.host else None
+        return PreparedRound(
+            equation,
+            answer,
+            ROUND_DIFFICULTY,
+            host_prompt,
+            encode_all({**host_prompt, "house": house_index}),
+            encode_all({"state": "prep_round"}),
+        )
+
+    async def collect_powerups(self, timeout: float) -> PowerUpResolver:
+        logger.info("Collecting powerups from %d players", len(self.players))
+
+        by_username: Dict[str, Player] = {player.username: player for player in self.players}
+        chosen: Dict[Player, Tuple[str, PowerUp, Optional[Player]]] = {}
+        async for player, data in self.receive_from_players(self.powerup_queue, timeout=timeout):
+            name: Any = data.get("powerup")
+            powerup: Optional[PowerUp] = POWERUPS.get(name) if isinstance(name, str) else None
+            if powerup is None or not self.cooldowns.ready(self.rows[player], name, self.round_index):
+                continue
+            target: Any = data.get("target")
+            target_player: Optional[Player] = by_username.get(target) if isinstance(target, str) else None
+            if powerup.targeted and (target_player is None or target_player is player):
+                continue
+            chosen[player] = (name, powerup, target_player if powerup.targeted else None)
+
+        # House order, so effects resolve the same way every time
+        activations: List[Tuple[Player, PowerUp, Optional[Player]]] = []
+        for row, player in enumerate(self.players):
+            name, player.active_powerup, player.powerup_target = chosen.get(player, (None, None, None))
+            if player.active_powerup is not None:
+                activations.append((player, player.active_powerup, player.powerup_target))
+                self.cooldowns.use(row, name, self.round_index, player.active_powerup.cooldown)
+
+        clear_queue(self.powerup_queue)
+        logger.info("Collected %d powerups", len(activations), extra={"event": "powerups_collected"})
+        return PowerUpResolver(activations)
+
+    def resolve_powerups(self, state: PowerUpState, results: Optional[RoundResults] = None) -> Dict[Player, List[Dict[str, Any]]]:
+        # Returns the attacks per player, the caller delivers them with its next broadcast.
+        # Score effects are added to results.gained, so round_ended reports the net change.
+        if not self.powerups.active(state):
+            return {}
+        totals, attacks = self.powerups.resolve(state, results.scores() if results is not None else None)
+        for player, total in totals.items():
+            if results is not None:
+                results.gained[results.rows[player]] += total - player.score
+            player.score = total
+        return attacks
+
+    @timed(phase_histogram("collect_answers"))
     async def collect_answers(self) -> Dict[Player, Optional[Dict[str, Any]]]:
-        logger.info(f"Collecting answers from {len(self.players)} players")
+        logger.info("Collecting answers from %d players", len(self.players))
 
-        tasks: Dict[asyncio.Task, Player] = {
-            asyncio.create_task(player.receive_data()): player
-            for player in self.players
-        }
         answers: Dict[Player, Optional[Dict[str, Any]]] = {}
 
-        start_time = asyncio.get_event_loop().time()
 
-        try:
-            for completed in asyncio.as_completed(tasks.keys(), timeout=self.time_per_question):
-                try:
-                    result = await completed
-                    player = next(p for p in self.players if p.username == result["username"])
-                    answers[player] = result
-                    
-
-                    logger.info(f"Player {player.username} submitted answer: {result}")
-                    if self.host:
-                        await self.host.send_data({
-                            "state": "ui_update",
-                            "player": player.to_json(),
-                            "update": "player_answered",
-                        })
-                except Exception as e:
-                    logger.exception(f"Error handling answer for task {completed}:")
-        except asyncio.TimeoutError:
-            logger.warning("Timed out waiting for player answers.")
-
-        for task, player in tasks.items():
+        async for player, result in self.receive_from_players(self.answer_queue, timeout=self.time_per_question):
+            answers[player] = result
+            self.state.elapsed[player.row] = self.answer_time(player, result["received_at"])
+
+            logger.info("Player %s submitted answer", player.username, extra={"event": "answer_submitted", "player": player.username})
+            self.scoreboard.set(self.rows[player], "answered", True)
+            await self.send_scoreboard()
+
+        for player in self.players:
             if player not in answers:
-                task.cancel()
                 answers[player] = None
-                logger.warning(f"Player {player.username} did not answer in time")
+                logger.info("Player %s did not answer in time", player.username, extra={"event": "answer_missed", "player": player.username})
 
-        end_time = asyncio.get_event_loop().time()
-        logger.info(f"Collected answers in {end_time - start_time:.2f}s: {answers}")
+        end_time: float = asyncio.get_running_loop().time()
+        logger.info("Collected answers in %.2fs", end_time - self.round_started_at, extra={"event": "answers_collected", "answered": sum(a is not None for a in answers.values())})
         return answers
 
+    def answer_time(self, player: Player, received_at: float) -> float:
+        # Server clock from the round_ongoing send to the answer's arrival, minus the
+        # round trip the two messages spent on the wire. The client's time_took is ignored.
+        compensation: float = min(player.rtt or 0.0, MAX_RTT_COMPENSATION)
+        return max(0.0, received_at - self.round_started_at - compensation)
 
     async def start_match(self, round_count: int) -> Player:
         logger.info(f"Starting match for {round_count} rounds")
+        self.bind_players()
+        self.rows = {player: row for row, player in enumerate(self.players)}
+        self.release()
+        self.state = HouseState(self.players)
+        self.scoreboard = Scoreboard(self.players)
+        self.leaderboard = Leaderboard(self.players)
 
-        current_status: str = "waiting_for_round_start"
-        round_index: int = 0
+        # A restored house that already played every round just reports its winner
+        current_status: str = "waiting_for_round_start" if self.round_index < round_count else "game_ended"
 
         while current_status != "game_ended":
             if current_status == "waiting_for_round_start":
                 current_status = await self.handle_round_start()
             elif current_status == "waiting_for_host":
-                current_status = await self.handle_host_phase(round_index, round_count)
-                round_index += 1
+                current_status = await self.handle_host_phase(self.round_index, round_count)
 
-        winner: Player = max(self.players, key=lambda p: p.score)
+        winner: Player = self.leaderboard.winner()
         return winner
     
+    def release(self) -> None:
+        if self.state is not None:
+            self.state.release()
+            self.state = None
+
     async def broadcast(self, state: Optional[str] = None, **extra: Any) -> None:
         data: Dict[str, Any] = {"state": state, **extra} if state else extra
-        await asyncio.gather(*(p.send_data(data) for p in self.players), return_exceptions=True)
+        fan_out(self.players, data)
 
+    @timed(phase_histogram("handle_round_start"))
     async def handle_round_start(self) -> str:
-        equation, answer = self.generate_equation()
-        logger.info(f"Equation: {equation}, Answer: {answer}")
+        # Rounds after the first were prepared during the round_end pause
+        prepared: PreparedRound = self.prepared or self.prepare_round()
+        self.prepared = None
+        self.answer = prepared.answer
+        self.powerups = prepared.powerups
 
+        self.host_prompt = prepared.host_prompt
         if self.host:
-            await self.host.send_data({"state": "prep_round", "equation": equation})
+            self.host.clear("started_round")
+            self.host.enqueue_frames(prepared.host_frames)
+        self.scoreboard.reset_answered()
+        await self.send_scoreboard()
 
-        await self.broadcast("prep_round")
+        fan_out_frames(self.players, prepared.player_frames)
         return "waiting_for_host"
 
+    @timed(phase_histogram("handle_host_phase"))
     async def handle_host_phase(self, round_index: int, total_rounds: int) -> str:
-        host_data: Dict[str, Any] = {}
         try:
-            while host_data.get("state") != "started_round":
-                host_data = await self.host.websocket.receive_json()
-                logger.info(f"Received data from host: {host_data}")
-        except Exception as e:
+            host_data: Dict[str, Any] = await self.host.receive_data("started_round")
+        except ConnectionError as e:
             logger.warning(f"Host disconnected unexpectedly: {e}")
             return "game_ended"
+        self.host_prompt = None
 
-        logger.info(f"Received host data: {host_data}")
+        logger.debug("Received host data: %s", host_data)
 
-        await self.broadcast("round_ongoing", answer=self.answer)
+        clear_queue(self.answer_queue)
+        # Attacks ride along in the attacked players' round_ongoing, one frame per player either way
+        attacks: Dict[Player, List[Dict[str, Any]]] = self.resolve_powerups(PowerUpState.ROUND_START)
+        self.round_started_at = asyncio.get_running_loop().time()
+        fan_out(self.players, {"state": "round_ongoing", "answer": self.answer}, {player: {"attacks": messages} for player, messages in attacks.items()})
         await self.host.send_data({"state": "round_ongoing", "current_round": round_index})
+        self.resolve_powerups(PowerUpState.MID_ROUND)
 
-        round_results = await self.collect_answers()
-        self.assign_scores(round_results, self.answer)
+        answers = await self.collect_answers()
+        self.results = self.assign_scores(answers, self.answer)
+        self.resolve_powerups(PowerUpState.ROUND_END, self.results)
         self.assign_player_places()
+        self.scoreboard.sync(self.players)
+        self.round_index = round_index + 1
+        self.cooldowns.expire(self.round_index)
+        if self.on_round_end:
+            self.on_round_end(self)
 
         logger.info("Round ended")
 
@@ -309,110 +663,247 @@ class House:
             return "game_ended"
 
     async def round_end_phase(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline: float = loop.time() + ROUND_END_PAUSE
+        self.resolve_powerups(PowerUpState.AFTER_ROUND)
         await self.broadcast_round_data()
+        await self.send_scoreboard()
         if self.host:
-            await self.host.send_data({"state": "round_ended", "players": [p.to_json() for p in self.players]})
-        await asyncio.sleep(5)
+            await self.host.send_data({"state": "round_ended"})
+        # The next round is built inside the pause, so the gap between rounds is the pause itself
+        self.prepared = self.prepare_round()
+        self.prepared.powerups = await self.collect_powerups(deadline - loop.time())
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
 
     async def broadcast_round_data(self) -> None:
-        await asyncio.gather(*(p.send_data({"state": "round_ended", "score": p.score, "place": p.place}) for p in self.players))
+        for player, correct, gained in zip(self.results.players, self.results.correct, self.results.gained):
+            await player.send_data({"state": "round_ended", "score": player.score, "place": player.place, "correct": correct, "gained": gained})
 
     async def end_game(self) -> None:
         await self.broadcast("game_over", **{p.username: p.score for p in self.players})
+        await self.send_scoreboard()
         if self.host:
-            await self.host.send_data({"state": "game_over", "players": [p.to_json() for p in self.players]})
+            await self.host.send_data({"state": "game_over"})
+
+    @timed(phase_histogram("assign_scores"))
+    def assign_scores(self, round_results: Dict[Player, Optional[Dict[str, Any]]], answer: int) -> RoundResults:
+        results: RoundResults = score_round(self.players, round_results, answer, self.time_per_question, self.rows, self.state.elapsed)
+        results.apply(self.state)
+        logger.info("Scored round: %d of %d correct", sum(results.correct), len(results), extra={"event": "round_scored"})
+        return results
+
+
+class HostRouter(MessageRouter):
+    def route_keys(self, data: Dict[str, Any]) -> List[Any]:
+        state: str = message_state(data)
+        house_index: Optional[int] = data.get("house")
+        if house_index is not None:
+            return [(state, house_index)]
+        # Untagged messages (single screen hosts) apply to every house, whether its
+        # route for the state is a queue or a handler (the scoreboard acks)
+        return [state] + [key for key in {**self.queues, **self.handlers} if isinstance(key, tuple) and key[0] == state]
+
+
+class Host(Connection):
+    __slots__ = ("lobby_id",)
+    router_class = HostRouter
+    # The host screen is never evicted, stale updates get coalesced instead
+    overflow_policy = OverflowPolicy.COALESCE
+    grace_period = SESSION_GRACE_PERIOD
 
-    def assign_scores(self, round_results: Dict[Player, Optional[Dict[str, Any]]], answer: int) -> Dict[str, int]:
-        scores: Dict[str, int] = {}
-        for player, data in round_results.items():
-            logger.info(f"Player {player.username} Data {data}")
-            try:
-                if data is not None and int(data.get("answer")) == answer:
-                    player.is_correct = True
-                    min_score: int = 100
-                    max_score: int = 500
-                    t: float = data.get("time_took", 0) / self.time_per_question
-                    score: int = round(min_score + (max_score - min_score) * (1 - t) ** 2)
-                    player.score += score
-                    scores[player.username] = player.score
-                    logger.info(f"Player {player.username} scored {score}")
-                else:
-                    player.is_correct = False
-                    scores[player.username] = player.score
-                    logger.info(f"Player {player.username} did not answer correctly")
-            except (TypeError, ValueError):
-                player.is_correct = False
-                scores[player.username] = player.score
-                logger.info(f"Player {player.username} did not answer correctly")
-
-
-class Host:
     def __init__(self, lobby_id: str, websocket: WebSocket) -> None:
         self.lobby_id: str = lobby_id
-        self.websocket: WebSocket = websocket
+        super().__init__(websocket)
+
+    def view(self, house_index: int) -> HostView:
+        return HostView(self, house_index)
+
+    def clear_views(self) -> None:
+        for key in [key for key in self.router.queues if isinstance(key, tuple)]:
+            self.router.unbind(key)
+        for key in [key for key in self.router.handlers if isinstance(key, tuple)]:
+            self.router.off(key)
+
+    def __repr__(self) -> str:
+        return f"Host({self.lobby_id})"
+
+
+class HostView:
+    __slots__ = ("host", "house_index")
+
+    def __init__(self, host: Host, house_index: int) -> None:
+        self.host: Host = host
+        self.house_index: int = house_index
+
+    async def send_data(self, data: Dict[str, Any], key: Optional[Any] = None) -> None:
+        if key is not None:
+            key = (key, self.house_index)
+        await self.host.send_data({**data, "house": self.house_index}, key)
+
+    async def receive_data(self, state: str) -> Dict[str, Any]:
+        return await self.host.router.get((state, self.house_index))
+
+    def on(self, state: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        self.host.router.on((state, self.house_index), handler)
+
+    def clear(self, state: str) -> None:
+        self.host.router.clear((state, self.house_index))
 
-    async def send_data(self, data: Dict[str, Any]) -> None:
-        await self.websocket.send_json(data)
-        logger.debug(f"Sent to host: {data}")
+    def enqueue_frames(self, frames: Dict[Encoding, Frame]) -> None:
+        self.host.enqueue(frames[self.host.encoding])
 
 
 lobby_manager: LobbyManager = LobbyManager()
+keep_alive: KeepAliveWheel = KeepAliveWheel(KEEP_ALIVE_INTERVAL)
+equation_bank: EquationBank = EquationBank()
+tournament_store: TournamentStore = TournamentStore(os.environ.get("STATE_DIR", "state"))
+
+REGISTRY.gauge("tournaments_active", "Tournaments held by the lobby manager", callback=lambda: len(lobby_manager.tournaments))
+REGISTRY.gauge("houses_active", "Houses of the current stage of every tournament", callback=lambda: sum(len(t.houses) for t in lobby_manager.tournaments.values()))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    return REGISTRY.render()
+
 
 @app.get("/host")
 async def get() -> str:
     id: str = lobby_manager.generate_id()
     logger.info(f"Host tournament request")
-    lobby_manager.tournaments[id] = Tournament(id)
+    tournament: Tournament = Tournament(id)
+    # Nothing is written to disk until the tournament starts, an unused lobby leaves no snapshot
+    lobby_manager.tournaments[id] = tournament
     return id
 
 
+@app.get("/leaderboard/{lobby_id}")
+async def leaderboard(lobby_id: str, k: int = 10) -> Dict[str, Any]:
+    tournament: Optional[Tournament] = lobby_manager.tournaments.get(lobby_id)
+    if tournament is None:
+        raise HTTPException(status_code=404, detail="Unknown lobby")
+    top: List[Player] = tournament.leaderboard.top(k)
+    return {"players": [{**player.to_json(), "rank": rank} for rank, player in enumerate(top, 1)]}
+
+
+def valid_token(token: Any) -> bool:
+    # Tokens come from the client, compare_digest and the sessions dict need an ASCII str
+    return isinstance(token, str) and token.isascii()
+
+
+async def accept(websocket: WebSocket) -> Optional[Encoding]:
+    # A client can ask for MessagePack with the "msgpack" websocket subprotocol
+    requested: List[str] = websocket.scope.get("subprotocols") or []
+    encoding: Optional[Encoding] = negotiate(requested)
+    await websocket.accept(subprotocol=encoding.value if encoding else None)
+    return encoding
+
+
+def join_encoding(join: Dict[str, Any], binary: bool) -> Encoding:
+    # Players can also ask in the join frame, or just send the join frame as MessagePack
+    requested: Any = join.get("encoding")
+    encoding: Optional[Encoding] = negotiate([requested]) if isinstance(requested, str) else None
+    if encoding is None and binary:
+        encoding = Encoding.MSGPACK
+    return encoding or Encoding.JSON
+
+
 @app.websocket("/ws/{lobby_id}")
 async def player_websocket_endpoint(websocket: WebSocket, lobby_id: str) -> None:
-    await websocket.accept()
+    encoding: Optional[Encoding] = await accept(websocket)
     tournament: Optional[Tournament] = lobby_manager.tournaments.get(lobby_id)
     if tournament:
-        username: str = (await websocket.receive_json())["username"]
-        player = Player(websocket, username)
-        logger.info(f"Player {username} connected to lobby {lobby_id}")
-        await player.start_keep_alive(KEEP_ALIVE_INTERVAL)
-
-        tournament.players.append(player)
-        players: List = [p.to_json() for p in tournament.players]
-        if tournament.host:
-            await tournament.host.send_data({"state": "waiting_for_start", "players": players})
-        await websocket.send_json({"state": "prep_game"})
+        message: Dict[str, Any] = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        join: Dict[str, Any] = decode(message)
+        encoding = encoding or join_encoding(join, message.get("bytes") is not None)
+        username: str = join["username"]
+        token: Any = join.get("token")
+        player: Optional[Player] = tournament.sessions.get(token) if valid_token(token) else None
+        if player is not None:
+            # Frames queued while the player was away go out before anything new,
+            # in the encoding they were queued with
+            logger.info(f"Player {username} resumed their session in lobby {lobby_id}")
+            player.attach(websocket)
+            player.encoding = encoding
+            keep_alive.add(player)
+            await player.send_data({"state": "session", "token": player.token, "resumed": True})
+        elif (player := tournament.rejoin(username)) is not None:
+            logger.info(f"Player {username} rejoined lobby {lobby_id}")
+            player.attach(websocket)
+            player.encoding = encoding
+            keep_alive.add(player)
+            await player.send_data({"state": "session", "token": player.token, "resumed": False})
+            await player.send_data({"state": "rejoined", "score": player.score, "place": player.place})
+        else:
+            player = Player(websocket, username)
+            player.encoding = encoding
+            logger.info(f"Player {username} connected to lobby {lobby_id}")
+            player.start()
+            keep_alive.add(player)
+            await player.send_data({"state": "session", "token": player.token, "resumed": False})
+
+            tournament.players.append(player)
+            tournament.sessions[player.token] = player
+            tournament.leaderboard.add(player)
+            players: List = [p.to_json() for p in tournament.players]
+            if tournament.host:
+                await tournament.host.send_data({"state": "waiting_for_start", "players": players}, key="roster")
+            await player.send_data({"state": "prep_game"})
 
         try:
-            while True:
-                await asyncio.sleep(IDLE_TIMEOUT)
-        except Exception:
+            await player.wait_closed()
             logger.info(f"Player {username} disconnected")
         finally:
-            if player in tournament.players:
-                tournament.players.remove(player)
-            if player.keep_alive_task:
-                player.keep_alive_task.cancel()
+            # A newer connection may have taken over this player already
+            if player.websocket is websocket:
+                player.close()
+                keep_alive.remove(player)
+                # Once started the player stays in the tournament so they can rejoin
+                if not tournament.started and player in tournament.players:
+                    tournament.players.remove(player)
+                    tournament.sessions.pop(player.token, None)
+                    tournament.leaderboard.remove(player)
     else:
         await websocket.close()
 
 
 @app.websocket("/ws/host/{lobby_id}")
-async def host_websocket_endpoint(websocket: WebSocket, lobby_id: str) -> None:
-    await websocket.accept()
+async def host_websocket_endpoint(websocket: WebSocket, lobby_id: str, token: Optional[str] = None) -> None:
+    encoding: Encoding = await accept(websocket) or Encoding.JSON
     logger.info(f"Host connected to lobby {lobby_id}")
     tournament: Optional[Tournament] = lobby_manager.tournaments.get(lobby_id)
     if tournament:
-        tournament.host = Host(lobby_id, websocket)
-        while True:
-            data: Dict[str, Any] = await websocket.receive_json()
-            if data["state"] == "start_game":
-                await tournament.start_tournament()
-                break
+        host: Optional[Host] = tournament.host
+        resumed: bool = host is not None and valid_token(token) and secrets.compare_digest(token, host.token)
+        if resumed:
+            # The houses keep waiting on the same Host, so a resume doesn't end them
+            logger.info(f"Host resumed their session in lobby {lobby_id}")
+            host.attach(websocket)
+            host.encoding = encoding
+        else:
+            host = Host(lobby_id, websocket)
+            host.encoding = encoding
+            tournament.attach_host(host)
+            host.start()
+        keep_alive.add(host)
+        await host.send_data({"state": "session", "token": host.token, "resumed": resumed})
+        if resumed:
+            await tournament.resend_host_prompts()
         try:
-            while True:
-                await asyncio.sleep(IDLE_TIMEOUT)
-        except Exception as e:
+            if not tournament.started:
+                await host.router.get("start_game")
+            if not tournament.running:
+                await tournament.start_tournament()
+            await host.wait_closed()
+            logger.info(f"Host disconnected from lobby {lobby_id}")
+        except ConnectionError as e:
             logger.info(f"Host disconnected: {e}")
+        finally:
+            if host.websocket is websocket:
+                host.close()
+                keep_alive.remove(host)
 
 
 if __name__ == "__main__":
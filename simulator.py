@@ -0,0 +1,285 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import random
+import selectors
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import WebSocketDisconnect
+
+import server
+from server import Host, House, Tournament
+from snapshots import TournamentStore
+from wire import Encoding, Frame, decode, encode
+
+SIMULATED_PHASES: List[str] = ["handle_round_start", "handle_host_phase", "collect_answers", "assign_scores", "round_end_phase"]
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    def __init__(self, loop: VirtualClockLoop) -> None:
+        super().__init__()
+        self.loop: VirtualClockLoop = loop
+
+    def select(self, timeout: Optional[float] = None):
+        events = super().select(0)
+        if not events and timeout is None:
+            # Nothing scheduled, only executor threads can wake us up
+            events = super().select(None)
+        elif not events:
+            # Jump straight to the next timer instead of sleeping
+            self.loop.virtual_time += timeout
+        return events
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    def __init__(self) -> None:
+        self.virtual_time: float = 0.0
+        self.iterations: int = 0
+        super().__init__(selector=VirtualSelector(self))
+
+    def time(self) -> float:
+        return self.virtual_time
+
+    def _run_once(self) -> None:
+        self.iterations += 1
+        super()._run_once()
+
+
+class FakeWebSocket:
+    # In-memory stand in for a starlette WebSocket, the bot talks to the other end
+    def __init__(self, encoding: Encoding = Encoding.JSON) -> None:
+        self.encoding: Encoding = encoding
+        self.scope: Dict[str, Any] = {"subprotocols": []}
+        self.to_server: asyncio.Queue = asyncio.Queue()
+        self.to_client: asyncio.Queue = asyncio.Queue()
+        self.closed: bool = False
+
+    async def accept(self, subprotocol: Optional[str] = None) -> None:
+        pass
+
+    async def send_text(self, text: str) -> None:
+        await self.send_bytes(text)
+
+    async def send_bytes(self, frame: Frame) -> None:
+        if self.closed:
+            raise WebSocketDisconnect()
+        self.to_client.put_nowait(frame)
+
+    async def receive(self) -> Dict[str, Any]:
+        frame: Optional[Frame] = await self.to_server.get()
+        if frame is None:
+            return {"type": "websocket.disconnect", "code": 1000}
+        if isinstance(frame, bytes):
+            return {"type": "websocket.receive", "bytes": frame}
+        return {"type": "websocket.receive", "text": frame}
+
+    async def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.to_server.put_nowait(None)
+            self.to_client.put_nowait(None)
+
+    def send(self, data: Dict[str, Any]) -> None:
+        self.to_server.put_nowait(encode(data, self.encoding))
+
+    async def recv(self) -> Optional[Dict[str, Any]]:
+        frame: Optional[Frame] = await self.to_client.get()
+        if frame is None:
+            return None
+        return decode({"bytes": frame} if isinstance(frame, bytes) else {"text": frame})
+
+
+class PhaseTimer:
+    def __init__(self) -> None:
+        self.virtual: Dict[str, List[float]] = defaultdict(list)
+        self.cpu: Dict[str, List[float]] = defaultdict(list)
+        self.originals: Dict[str, Callable] = {}
+
+    def install(self) -> None:
+        for name in SIMULATED_PHASES:
+            original: Callable = getattr(House, name)
+            self.originals[name] = original
+            setattr(House, name, self.wrap(name, original))
+
+    def uninstall(self) -> None:
+        for name, original in self.originals.items():
+            setattr(House, name, original)
+
+    def wrap(self, name: str, original: Callable) -> Callable:
+        timer = self
+
+        if not asyncio.iscoroutinefunction(original):
+            def timed(*args: Any, **kwargs: Any) -> Any:
+                start: float = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    timer.cpu[name].append(time.perf_counter() - start)
+            return timed
+
+        async def timed_async(*args: Any, **kwargs: Any) -> Any:
+            loop = asyncio.get_running_loop()
+            start: float = loop.time()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                timer.virtual[name].append(loop.time() - start)
+        return timed_async
+
+
+async def player_bot(websocket: FakeWebSocket, username: str) -> None:
+    # Same behaviour as player_client.py: random correctness and random time_took
+    websocket.send({"username": username, "encoding": websocket.encoding.value})
+    while True:
+        data: Optional[Dict[str, Any]] = await websocket.recv()
+        if data is None:
+            return
+        if data.get("type") == "ping":
+            websocket.send({"type": "pong"})
+        elif data.get("state") == "round_ongoing":
+            answer: Any = data.get("answer") if random.choice([True, False]) else str(random.randint(1, 100))
+            time_took: int = round(random.uniform(0.5, 6.0))
+            await asyncio.sleep(time_took)
+            websocket.send({"username": username, "answer": answer, "time_took": time_took})
+
+
+async def host_bot(websocket: FakeWebSocket, display_time: float) -> None:
+    # Like host_client.py, every house's equation is shown on its own timer so the
+    # bot keeps reading (and answering pings) while the houses run
+    async def start_round(house: Any) -> None:
+        await asyncio.sleep(display_time)
+        websocket.send({"state": "started_round", "house": house})
+
+    rounds: List[asyncio.Task] = []
+    while True:
+        data: Optional[Dict[str, Any]] = await websocket.recv()
+        if data is None:
+            for task in rounds:
+                task.cancel()
+            return
+        if data.get("type") == "ping":
+            websocket.send({"type": "pong"})
+        elif data.get("state") == "prep_round":
+            rounds = [task for task in rounds if not task.done()]
+            rounds.append(asyncio.create_task(start_round(data.get("house"))))
+        elif data.get("state") == "scoreboard":
+            websocket.send({"state": "scoreboard_ack", "house": data.get("house"), "board": data["board"], "version": data["version"]})
+
+
+async def run_tournament(player_count: int, display_time: float, encoding: Encoding = Encoding.JSON) -> None:
+    lobby_id: str = await server.get()
+    tournament: Tournament = server.lobby_manager.tournaments[lobby_id]
+
+    # The host side mirrors host_websocket_endpoint, it just starts without a start_game frame
+    host_socket: FakeWebSocket = FakeWebSocket(encoding)
+    host: Host = Host(lobby_id, host_socket)
+    host.encoding = encoding
+    tournament.host = host
+    host.start()
+    server.keep_alive.add(host)
+    bots: List[asyncio.Task] = [asyncio.create_task(host_bot(host_socket, display_time))]
+
+    sockets: List[FakeWebSocket] = []
+    endpoints: List[asyncio.Task] = []
+    for i in range(player_count):
+        websocket: FakeWebSocket = FakeWebSocket(encoding)
+        sockets.append(websocket)
+        endpoints.append(asyncio.create_task(server.player_websocket_endpoint(websocket, lobby_id)))
+        bots.append(asyncio.create_task(player_bot(websocket, f"bot{i}")))
+
+    while len(tournament.players) < player_count:
+        await asyncio.sleep(0.1)
+
+    try:
+        await tournament.start_tournament()
+    finally:
+        # Close the sessions first so nobody sits out the resume grace period
+        for player in tournament.players:
+            player.close()
+        host.close()
+        for websocket in sockets + [host_socket]:
+            await websocket.close()
+        server.keep_alive.remove(host)
+        await asyncio.gather(*endpoints, *bots, return_exceptions=True)
+        del server.lobby_manager.tournaments[lobby_id]
+
+
+async def simulate(tournaments: int, players: int, concurrency: int, display_time: float, encoding: Encoding = Encoding.JSON) -> None:
+    await server.equation_bank.fill()
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one() -> None:
+        async with semaphore:
+            await run_tournament(players, display_time, encoding)
+
+    results = await asyncio.gather(*(run_one() for _ in range(tournaments)), return_exceptions=True)
+    failures: List[BaseException] = [r for r in results if isinstance(r, BaseException)]
+    for failure in failures[:5]:
+        logging.error(f"Tournament failed: {failure!r}")
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "max": samples[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run full tournaments against in-memory bots on a virtual clock")
+    parser.add_argument("--tournaments", type=int, default=100)
+    parser.add_argument("--players", type=int, default=9)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--display-time", type=float, default=2, help="seconds the host bot shows each equation")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--state-dir", default=None, help="write tournament snapshots here, off by default")
+    parser.add_argument("--encoding", choices=[encoding.value for encoding in Encoding], default="json", help="wire encoding the bots negotiate")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    server.tournament_store = TournamentStore(args.state_dir)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    timer: PhaseTimer = PhaseTimer()
+    timer.install()
+    loop: VirtualClockLoop = VirtualClockLoop()
+    wall_start: float = time.perf_counter()
+    cpu_start: float = time.process_time()
+    try:
+        loop.run_until_complete(simulate(args.tournaments, args.players, args.concurrency, args.display_time, Encoding(args.encoding)))
+    finally:
+        timer.uninstall()
+        loop.close()
+    wall: float = time.perf_counter() - wall_start
+    cpu: float = time.process_time() - cpu_start
+
+    report: Dict[str, Any] = {
+        "tournaments": args.tournaments,
+        "players": args.players,
+        "virtual_seconds": loop.virtual_time,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "speedup": loop.virtual_time / wall if wall else None,
+        "loop_iterations": loop.iterations,
+        "cpu_us_per_iteration": cpu / loop.iterations * 1e6 if loop.iterations else None,
+        "phase_virtual_seconds": {name: summarize(samples) for name, samples in timer.virtual.items()},
+        "phase_cpu_seconds": {name: summarize(samples) for name, samples in timer.cpu.items()},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import json
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+from wire import encode_json
+
+SNAPSHOT_SUFFIX: str = ".snapshot.json"
+JOURNAL_SUFFIX: str = ".journal.jsonl"
+
+logger = logging.getLogger(__name__)
+
+
+# A snapshot holds the whole tournament, the journal only the rounds played since it.
+# Recovery reads one snapshot plus a bounded journal, never the game history.
+class TournamentStore:
+    def __init__(self, directory: Optional[str]) -> None:
+        self.directory: Optional[str] = directory
+        # One writer thread keeps snapshot and journal writes in order and off the event loop
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tournament-store")
+        self.journals: Dict[str, IO[str]] = {}
+        # Created by the first write, so constructing a store has no side effects
+        self.created: bool = False
+
+    def path(self, tournament_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, tournament_id + suffix)
+
+    def create_directory(self) -> None:
+        # Only called on the writer thread
+        if not self.created:
+            os.makedirs(self.directory, exist_ok=True)
+            self.created = True
+
+    def submit(self, function: Any, *args: Any) -> None:
+        future: Future = self.executor.submit(function, *args)
+
+        def done(future: Future) -> None:
+            if future.exception():
+                logger.error(f"Tournament store write failed: {future.exception()!r}")
+
+        future.add_done_callback(done)
+
+    def snapshot(self, tournament_id: str, state: Dict[str, Any]) -> None:
+        if self.directory:
+            # Encode on the loop so the state can't change under the writer thread
+            self.submit(self.write_snapshot, tournament_id, encode_json(state))
+
+    def append(self, tournament_id: str, record: Dict[str, Any]) -> None:
+        if self.directory:
+            self.submit(self.write_journal, tournament_id, encode_json(record) + "\n")
+
+    def remove(self, tournament_id: str) -> None:
+        if self.directory:
+            self.submit(self.delete, tournament_id)
+
+    def write_snapshot(self, tournament_id: str, text: str) -> None:
+        self.create_directory()
+        path: str = self.path(tournament_id, SNAPSHOT_SUFFIX)
+        with open(path + ".tmp", "w") as file:
+            file.write(text)
+        os.replace(path + ".tmp", path)
+        # Everything in the journal is now part of the snapshot
+        self.close_journal(tournament_id)
+        open(self.path(tournament_id, JOURNAL_SUFFIX), "w").close()
+
+    def write_journal(self, tournament_id: str, line: str) -> None:
+        journal: Optional[IO[str]] = self.journals.get(tournament_id)
+        if journal is None:
+            self.create_directory()
+            journal = self.journals[tournament_id] = open(self.path(tournament_id, JOURNAL_SUFFIX), "a")
+        # Flushed to the OS on every round, which survives a process crash but not a power cut
+        journal.write(line)
+        journal.flush()
+
+    def close_journal(self, tournament_id: str) -> None:
+        journal: Optional[IO[str]] = self.journals.pop(tournament_id, None)
+        if journal is not None:
+            journal.close()
+
+    def delete(self, tournament_id: str) -> None:
+        self.close_journal(tournament_id)
+        for suffix in (SNAPSHOT_SUFFIX, JOURNAL_SUFFIX):
+            try:
+                os.remove(self.path(tournament_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def load(self, prefix: str = "") -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        if not self.directory:
+            return []
+
+        loaded: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]] = []
+        if not os.path.isdir(self.directory):
+            return loaded
+        for name in os.listdir(self.directory):
+            if not (name.endswith(SNAPSHOT_SUFFIX) and name.startswith(prefix)):
+                continue
+            tournament_id: str = name[:-len(SNAPSHOT_SUFFIX)]
+            try:
+                with open(self.path(tournament_id, SNAPSHOT_SUFFIX)) as file:
+                    state: Dict[str, Any] = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping unreadable snapshot for {tournament_id}: {e!r}")
+                continue
+
+            records: List[Dict[str, Any]] = []
+            try:
+                with open(self.path(tournament_id, JOURNAL_SUFFIX)) as file:
+                    for line in file:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            # Torn last line from a crash mid-write
+                            break
+            except FileNotFoundError:
+                pass
+            loaded.append((state, records))
+        return loaded
@@ -0,0 +1,86 @@
+from __future__ import annotations
+import atexit
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from metrics import REGISTRY, Counter
+
+LOG_QUEUE_SIZE: int = 10000
+
+# Fraction of records kept per event, events not listed are always kept
+SAMPLE_RATES: Dict[str, float] = {
+    "answer_submitted": 0.05,
+}
+
+LOGS_DROPPED: Counter = REGISTRY.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+LOGS_SAMPLED_OUT: Counter = REGISTRY.counter("log_records_sampled_out_total", "Log records skipped by per-event sampling")
+
+STANDARD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates: Dict[str, float] = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate: Optional[float] = self.rates.get(getattr(record, "event", None))
+        if rate is None or random.random() < rate:
+            return True
+        LOGS_SAMPLED_OUT.inc()
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Never blocks the event loop: a full queue drops the record and counts it
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the %-interpolation happens on the loop, so later mutations of the
+        # arguments can't leak in; JSON formatting and I/O run on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level: int = logging.INFO, sample_rates: Optional[Dict[str, float]] = None) -> QueueListener:
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    stream: logging.Handler = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter())
+    listener: QueueListener = QueueListener(log_queue, stream, respect_handler_level=True)
+
+    handler: QueueHandler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(SAMPLE_RATES if sample_rates is None else sample_rates))
+
+    root: logging.Logger = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
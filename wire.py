@@ -0,0 +1,117 @@
+from __future__ import annotations
+import json
+import time
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional, Union
+
+from metrics import REGISTRY, Histogram
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FAN_OUT_SECONDS: Histogram = REGISTRY.histogram("broadcast_fan_out_seconds", "Time to encode a broadcast and queue it for every recipient")
+
+# Text frames carry JSON, binary frames carry MessagePack
+Frame = Union[str, bytes]
+
+
+class Encoding(str, Enum):
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+
+# MessagePack frames send "state" and "type" as these codes. Only ever append, clients
+# keep the table. States missing here go out as strings.
+STATES = [
+    "session", "rejoined", "waiting_for_game", "waiting_for_start", "starting_game", "prep_game",
+    "prep_round", "round_ongoing", "round_ended", "game_over", "scoreboard", "scoreboard_ack",
+    "scoreboard_resync", "answer_submitted", "powerup", "started_round", "start_game", "ping", "pong",
+]
+STATE_CODES: Dict[str, int] = {state: code for code, state in enumerate(STATES, 1)}
+CODE_FIELDS = ("state", "type")
+
+
+def encodings() -> Iterable[Encoding]:
+    return (Encoding.JSON, Encoding.MSGPACK) if msgpack is not None else (Encoding.JSON,)
+
+
+def negotiate(requested: Iterable[Any]) -> Optional[Encoding]:
+    # First requested encoding we can speak, None leaves the connection's current one
+    for name in requested:
+        if name in (encoding.value for encoding in encodings()):
+            return Encoding(name)
+    return None
+
+
+def encode_json(data: Dict[str, Any]) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_msgpack(data: Dict[str, Any]) -> bytes:
+    coded: Dict[str, Any] = data
+    for field in CODE_FIELDS:
+        value: Any = data.get(field)
+        if isinstance(value, str) and value in STATE_CODES:
+            if coded is data:
+                coded = dict(data)
+            coded[field] = STATE_CODES[value]
+    return msgpack.packb(coded)
+
+
+def encode(data: Dict[str, Any], encoding: Encoding = Encoding.JSON) -> Frame:
+    if encoding is Encoding.MSGPACK:
+        return encode_msgpack(data)
+    return encode_json(data)
+
+
+def encode_all(data: Dict[str, Any]) -> Dict[Encoding, Frame]:
+    # For frames built ahead of time, before it's known who they go to
+    return {encoding: encode(data, encoding) for encoding in encodings()}
+
+
+def decode(message: Dict[str, Any]) -> Any:
+    # An ASGI websocket.receive message, the frame type says how it was encoded
+    if message.get("bytes") is None:
+        return json.loads(message.get("text") or "null")
+    if msgpack is None:
+        raise ValueError("Binary frame but msgpack is not installed")
+    data: Any = msgpack.unpackb(message["bytes"])
+    if isinstance(data, dict):
+        for field in CODE_FIELDS:
+            value: Any = data.get(field)
+            if isinstance(value, int) and 0 < value <= len(STATES):
+                data[field] = STATES[value - 1]
+    return data
+
+
+def fan_out(connections: Iterable[Any], data: Dict[str, Any], personal: Optional[Dict[Any, Dict[str, Any]]] = None) -> None:
+    # One serialization per payload and encoding, every recipient queues the same frame.
+    # Recipients in personal get their own frame instead, the shared one with their fields added.
+    start: float = time.perf_counter()
+    frames: Dict[Encoding, Frame] = {}
+    for connection in connections:
+        if personal and connection in personal:
+            connection.enqueue(encode({**data, **personal[connection]}, connection.encoding))
+            continue
+        frame: Optional[Frame] = frames.get(connection.encoding)
+        if frame is None:
+            frame = frames[connection.encoding] = encode(data, connection.encoding)
+        connection.enqueue(frame)
+    FAN_OUT_SECONDS.observe(time.perf_counter() - start)
+
+
+def fan_out_frames(connections: Iterable[Any], frames: Dict[Encoding, Frame]) -> None:
+    # For frames encoded ahead of time with encode_all
+    start: float = time.perf_counter()
+    for connection in connections:
+        connection.enqueue(frames[connection.encoding])
+    FAN_OUT_SECONDS.observe(time.perf_counter() - start)